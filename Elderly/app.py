@@ -1,16 +1,22 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context
 import os
 import tempfile
 import json
+import re
 import logging
+import uuid
 from werkzeug.utils import secure_filename
 from datetime import datetime
 
 # Import our services
-from services.stt_service import STTService
-from services.tts_service import synthesize_speech
-from services.cognitive_monitor import analyze_text
-from services.mistral_handler import get_ai_response
+from services.stt_service import STTService, CHUNK_BYTES
+from services.tts_service import synthesize_cached, synthesize_sentences, audio_cache
+from services.cognitive_monitor import analyze_text, score_sentiments
+from services.mistral_handler import get_ai_response, stream_ai_response
+from services import llm_client
+from services.record_store import RecordStore
+from services.emergency_alerts import emergency_detector
+from services import sentiment_scorer
 
 app = Flask(__name__, static_folder='./dist', static_url_path='/')
 
@@ -21,14 +27,30 @@ logger = logging.getLogger(__name__)
 # Initialize services
 MODEL_PATH = os.environ.get('VOSK_MODEL_PATH', 'models/vosk-model-small-en-us-0.15')
 stt_service = STTService(MODEL_PATH)
+sentiment_scorer.start_warm_up()
 
 # Create directories for storing audio and data
 os.makedirs('temp', exist_ok=True)
 os.makedirs('data', exist_ok=True)
 
-# Store conversation history and mood records
-conversation_history = []
-mood_records = []
+# Store conversation history and mood records, partitioned per user/device
+conversation_store = RecordStore('data/conversations', legacy_file='data/conversation_history.json')
+mood_store = RecordStore('data/moods', legacy_file='data/mood_records.json')
+
+def partition_key(data):
+    return data.get('user_id') or data.get('device_id')
+
+def paginate(store):
+    key = partition_key(request.args)
+    offset = request.args.get('offset', 0, type=int)
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    records, total = store.page(key, offset=offset, limit=limit)
+    return jsonify({
+        'records': records,
+        'offset': offset,
+        'limit': limit,
+        'total': total
+    })
 
 @app.route('/')
 def index():
@@ -42,28 +64,75 @@ def process_audio():
         
         audio_file = request.files['audio']
         
-        # Save the audio file temporarily
-        temp_audio_path = os.path.join('temp', f"recording_{datetime.now().strftime('%Y%m%d%H%M%S')}.wav")
+        # Save the audio file temporarily (unique name: uploads are transcribed in parallel)
+        temp_audio_path = os.path.join('temp', f"recording_{uuid.uuid4()}.wav")
         audio_file.save(temp_audio_path)
         
-        # Transcribe the audio
-        transcription = stt_service.transcribe(temp_audio_path)
+        # Transcribe the audio on the shared worker pool, checking partial
+        # results for emergencies before transcription finishes
+        watch = emergency_detector.watch('process-audio')
+        try:
+            transcription = stt_service.submit(temp_audio_path, on_text=watch.check).result()
+        finally:
+            # Clean up the temporary file
+            os.remove(temp_audio_path)
         
         # Analyze the text
         analysis_result = analyze_text(transcription)
         
-        # Clean up the temporary file
-        os.remove(temp_audio_path)
-        
         return jsonify({
             'transcription': transcription,
-            'analysis': analysis_result
+            'analysis': analysis_result,
+            'emergency_alerts': watch.alerts
         })
         
     except Exception as e:
         logger.error(f"Error processing audio: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def iter_request_chunks(stream, chunk_size=CHUNK_BYTES):
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+@app.route('/api/process-audio/stream', methods=['POST'])
+def process_audio_stream():
+    # Body is raw 16-bit mono PCM sent with chunked transfer encoding.
+    # Responds with newline-delimited JSON events as speech is recognized.
+    sample_rate = request.args.get('sample_rate', 16000, type=int)
+    audio_stream = request.stream
+    watch = emergency_detector.watch('process-audio-stream')
+
+    def generate():
+        try:
+            for event in stt_service.stream_transcribe(iter_request_chunks(audio_stream), sample_rate):
+                # Emergency fast path runs on every partial, ahead of any other analysis
+                alert = watch.check(event['text'])
+                if alert:
+                    yield json.dumps({'type': 'emergency', 'alert': alert}) + "\n"
+                if event['type'] != 'partial' and event['transcription']:
+                    event['analysis'] = analyze_text(event['transcription'])
+                yield json.dumps(event) + "\n"
+        except Exception as e:
+            logger.error(f"Error streaming audio: {str(e)}")
+            yield json.dumps({'type': 'error', 'error': str(e)}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/api/stt-metrics', methods=['GET'])
+def stt_metrics():
+    return jsonify(stt_service.metrics())
+
+@app.route('/api/emergency-metrics', methods=['GET'])
+def emergency_metrics():
+    return jsonify(emergency_detector.metrics())
+
+@app.route('/api/llm-metrics', methods=['GET'])
+def llm_metrics():
+    return jsonify(llm_client.get_metrics())
+
 @app.route('/api/analyze-text', methods=['POST'])
 def analyze_text_endpoint():
     try:
@@ -80,6 +149,41 @@ def analyze_text_endpoint():
         logger.error(f"Error analyzing text: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/sentiment-batch', methods=['POST'])
+def sentiment_batch():
+    try:
+        data = request.json
+        if not data or not isinstance(data.get('texts'), list):
+            return jsonify({'error': 'No texts provided'}), 400
+        if not all(isinstance(text, str) for text in data['texts']):
+            return jsonify({'error': 'texts must be a list of strings'}), 400
+        
+        return jsonify({'results': score_sentiments(data['texts'])})
+        
+    except Exception as e:
+        logger.error(f"Error scoring sentiment batch: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+def record_exchange(user_message, analysis, ai_response, key=None):
+    # Append both sides of the exchange to conversation history
+    conversation_store.append(
+        key,
+        {
+            'role': 'user',
+            'content': user_message,
+            'timestamp': datetime.now().isoformat(),
+            'analysis': analysis
+        },
+        {
+            'role': 'assistant',
+            'content': ai_response,
+            'timestamp': datetime.now().isoformat()
+        }
+    )
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
     try:
@@ -90,37 +194,62 @@ def chat():
         user_message = data['message']
         analysis = data.get('analysis', {})
         
-        # Add to conversation history
-        conversation_history.append({
-            'role': 'user',
-            'content': user_message,
-            'timestamp': datetime.now().isoformat(),
-            'analysis': analysis
-        })
+        # Raise any emergency before waiting on the LLM
+        alert = emergency_detector.check(user_message, 'chat')
         
         # Get AI response
         ai_response = get_ai_response(user_message)
         
-        # Add AI response to history
-        conversation_history.append({
-            'role': 'assistant',
-            'content': ai_response,
-            'timestamp': datetime.now().isoformat()
-        })
-        
-        # Save conversation history periodically
-        if len(conversation_history) % 10 == 0:
-            with open('data/conversation_history.json', 'w') as f:
-                json.dump(conversation_history, f, indent=2)
+        record_exchange(user_message, analysis, ai_response, partition_key(data))
         
         return jsonify({
-            'response': ai_response
+            'response': ai_response,
+            'emergency_alert': alert
         })
         
     except Exception as e:
         logger.error(f"Error in chat: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    # Same as /api/chat, but relays reply tokens as server-sent events
+    data = request.json
+    if not data or 'message' not in data:
+        return jsonify({'error': 'No message provided'}), 400
+    
+    user_message = data['message']
+    analysis = data.get('analysis', {})
+    key = partition_key(data)
+    alert = emergency_detector.check(user_message, 'chat')
+    
+    def generate():
+        reply_parts = []
+        try:
+            if alert:
+                yield sse_event('emergency', {'alert': alert})
+            for token in stream_ai_response(user_message):
+                reply_parts.append(token)
+                yield sse_event('token', {'token': token})
+            
+            # Persist only once the full reply is known
+            ai_response = "".join(reply_parts).strip()
+            record_exchange(user_message, analysis, ai_response, key)
+            yield sse_event('done', {'response': ai_response})
+        except Exception as e:
+            logger.error(f"Error in chat stream: {str(e)}")
+            yield sse_event('error', {'error': str(e)})
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/conversation-history', methods=['GET'])
+def conversation_history():
+    return paginate(conversation_store)
+
 @app.route('/api/tts', methods=['GET'])
 def text_to_speech():
     try:
@@ -128,12 +257,8 @@ def text_to_speech():
         if not text:
             return jsonify({'error': 'No text provided'}), 400
         
-        # Generate a unique filename
-        filename = f"speech_{datetime.now().strftime('%Y%m%d%H%M%S')}.mp3"
-        output_path = os.path.join('temp', filename)
-        
-        # Generate speech
-        synthesize_speech(text, output_path)
+        # Reuse cached audio for text we've already spoken
+        _, output_path = synthesize_cached(text)
         
         # Send the file
         return send_file(output_path, mimetype='audio/mpeg')
@@ -142,6 +267,35 @@ def text_to_speech():
         logger.error(f"Error in text-to-speech: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/tts/stream', methods=['GET'])
+def text_to_speech_stream():
+    # Synthesizes sentence by sentence and emits one NDJSON line per ready clip,
+    # so the client can start playing the first sentence right away
+    text = request.args.get('text')
+    if not text:
+        return jsonify({'error': 'No text provided'}), 400
+    
+    def generate():
+        try:
+            for index, (sentence, key, _) in enumerate(synthesize_sentences(text)):
+                yield json.dumps({
+                    'index': index,
+                    'text': sentence,
+                    'url': f"/api/tts/audio/{key}"
+                }) + "\n"
+        except Exception as e:
+            logger.error(f"Error in text-to-speech stream: {str(e)}")
+            yield json.dumps({'error': str(e)}) + "\n"
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/api/tts/audio/<key>', methods=['GET'])
+def tts_audio(key):
+    path = audio_cache.get(key) if re.fullmatch(r'[0-9a-f]{64}', key) else None
+    if not path:
+        return jsonify({'error': 'Audio not found'}), 404
+    return send_file(path, mimetype='audio/mpeg')
+
 @app.route('/api/save-mood', methods=['POST'])
 def save_mood():
     try:
@@ -153,12 +307,8 @@ def save_mood():
         if 'timestamp' not in data:
             data['timestamp'] = datetime.now().isoformat()
         
-        # Add to mood records
-        mood_records.append(data)
-        
-        # Save mood records
-        with open('data/mood_records.json', 'w') as f:
-            json.dump(mood_records, f, indent=2)
+        # Append to this user's mood records
+        mood_store.append(partition_key(data), data)
         
         return jsonify({'success': True})
         
@@ -166,6 +316,10 @@ def save_mood():
         logger.error(f"Error saving mood: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/mood-records', methods=['GET'])
+def mood_records():
+    return paginate(mood_store)
+
 # Catch-all route to handle client-side routing
 @app.route('/<path:path>')
 def catch_all(path):
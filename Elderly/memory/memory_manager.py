@@ -1,8 +1,16 @@
+import copy
 import json
 import os
 import re
+import threading
+
+from services.keyword_matcher import ReloadableKeywordMatcher
 
 MEMORY_FILE = "memory/memory.json"
+# Rough cap on the size of the memory block injected into prompts (~4 chars per token)
+MEMORY_CONTEXT_TOKEN_BUDGET = int(os.environ.get("MEMORY_CONTEXT_TOKEN_BUDGET", "150"))
+# Always offered to the prompt first; everything else follows most recently updated first
+PRIORITY_FACTS = ("name", "health_conditions", "medications")
 
 # Ensure memory file exists
 os.makedirs("memory", exist_ok=True)
@@ -10,71 +18,139 @@ if not os.path.exists(MEMORY_FILE):
     with open(MEMORY_FILE, "w") as f:
         json.dump({}, f)
 
+# Very simple pattern-based extraction (can be upgraded).
+# Each pattern is compiled once and searched separately, so one fact's match
+# (e.g. the greedy doctor name) can't swallow text another fact needs.
+FACT_PATTERNS = {
+    "name": r"my name is (?P<name_value>[A-Za-z]+)",
+    "daughter": r"my daughter'?s name is (?P<daughter_value>[A-Za-z]+)",
+    "son": r"my son'?s name is (?P<son_value>[A-Za-z]+)",
+    "pet": r"my (?P<pet_type>dog|cat|pet)'?s name is (?P<pet_value>[A-Za-z]+)",
+    "favorite_color": r"my favorite color is (?P<favorite_color_value>[A-Za-z]+)",
+    "age": r"I am (?P<age_value>\d+) years old",
+    "health_condition": r"I have (?P<health_condition_value>arthritis|diabetes|hypertension|asthma)",
+    "medication": r"I(?:'m| am) taking (?P<medication_value>[A-Za-z]+)",
+    "doctor": r"my doctor'?s name is (?P<doctor_value>[A-Za-z ]+)",
+    "appointment": r"(?:have|got) (?:a|an) appointment on (?P<appointment_value>[A-Za-z]+ \d+)",
+}
+FACT_REGEXES = {key: re.compile(pattern, re.IGNORECASE) for key, pattern in FACT_PATTERNS.items()}
+
+_lock = threading.RLock()
+_cache = {"mtime": None, "memories": {}, "context": ""}
+
+def _load_cached():
+    # Re-read the file only when it has changed on disk
+    mtime = os.stat(MEMORY_FILE).st_mtime_ns
+    if _cache["mtime"] != mtime:
+        with open(MEMORY_FILE, "r") as f:
+            _cache["memories"] = json.load(f)
+        _cache["context"] = format_memory_context(_cache["memories"])
+        _cache["mtime"] = mtime
+    return _cache["memories"]
+
 def load_memories():
-    with open(MEMORY_FILE, "r") as f:
-        return json.load(f)
+    with _lock:
+        return copy.deepcopy(_load_cached())
 
 def save_memories(memories):
-    with open(MEMORY_FILE, "w") as f:
-        json.dump(memories, f, indent=2)
+    with _lock:
+        # Write to a temp file and swap it in so readers never see a partial file
+        tmp_path = MEMORY_FILE + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(memories, f, indent=2)
+        os.replace(tmp_path, MEMORY_FILE)
+        _cache["memories"] = copy.deepcopy(memories)
+        _cache["context"] = format_memory_context(memories)
+        _cache["mtime"] = os.stat(MEMORY_FILE).st_mtime_ns
+
+def find_facts(text):
+    """Returns {fact key: match} for the first match of each fact in text."""
+    found = {}
+    for key, regex in FACT_REGEXES.items():
+        match = regex.search(text)
+        if match:
+            found[key] = match
+    return found
+
+def apply_facts(memories, text):
+    """Updates memories in place with facts found in text; returns True if anything changed."""
+    changed = False
+
+    # Updated facts are moved to the end, so key order doubles as recency
+    def set_value(field, value):
+        nonlocal changed
+        if memories.get(field) != value:
+            memories.pop(field, None)
+            memories[field] = value
+            changed = True
+
+    def add_to_list(field, value):
+        nonlocal changed
+        values = memories.get(field, [])
+        if value not in values:
+            memories.pop(field, None)
+            memories[field] = values + [value]
+            changed = True
+
+    for key, match in find_facts(text).items():
+        value = match.group(f"{key}_value")
+        if key == "pet":
+            set_value(f"{match.group('pet_type')}_name", value.capitalize())
+        elif key == "medication":
+            add_to_list("medications", value.capitalize())
+        elif key == "health_condition":
+            add_to_list("health_conditions", value.lower())
+        elif key == "appointment":
+            set_value("appointment_date", value)
+        else:
+            set_value(key, value.capitalize())
+    return changed
 
 def extract_facts(text):
-    memories = load_memories()
-    # Very simple pattern-based extraction (can be upgraded)
-    patterns = {
-        "name": r"my name is ([A-Za-z]+)",
-        "daughter": r"my daughter'?s name is ([A-Za-z]+)",
-        "son": r"my son'?s name is ([A-Za-z]+)",
-        "pet": r"my (dog|cat|pet)'?s name is ([A-Za-z]+)",
-        "favorite_color": r"my favorite color is ([A-Za-z]+)",
-        "age": r"I am (\d+) years old",
-        "health_condition": r"I have (arthritis|diabetes|hypertension|asthma)",
-        "medication": r"I('m| am) taking ([A-Za-z]+)",
-        "doctor": r"my doctor'?s name is ([A-Za-z ]+)",
-        "appointment": r"(have|got) (a|an) appointment on ([A-Za-z]+ \d+)",
-    }
+    return extract_facts_batch([text])
 
-    for key, pattern in patterns.items():
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            if key == "pet":
-                pet_type = match.group(1)
-                pet_name = match.group(2)
-                memories[f"{pet_type}_name"] = pet_name.capitalize()
-            elif key == "medication":
-                medication = match.group(2)
-                if "medications" not in memories:
-                    memories["medications"] = []
-                if medication.capitalize() not in memories["medications"]:
-                    memories["medications"].append(medication.capitalize())
-            elif key == "health_condition":
-                condition = match.group(1)
-                if "health_conditions" not in memories:
-                    memories["health_conditions"] = []
-                if condition.lower() not in memories["health_conditions"]:
-                    memories["health_conditions"].append(condition.lower())
-            elif key == "appointment":
-                date = match.group(3)
-                memories["appointment_date"] = date
-            else:
-                value = match.group(1)
-                memories[key] = value.capitalize()
-
-    save_memories(memories)
-    return memories
+def extract_facts_batch(texts):
+    # Applies every transcript in order, then writes at most once
+    with _lock:
+        memories = copy.deepcopy(_load_cached())
+        changed = False
+        for text in texts:
+            if apply_facts(memories, text):
+                changed = True
+        if changed:
+            save_memories(memories)
+        return memories
+
+def _format_fact(key, value):
+    if isinstance(value, list):
+        # Most recent list entries first so truncation drops the oldest
+        value = ", ".join(reversed(value))
+    return f"{key.replace('_', ' ').capitalize()}: {value}"
+
+def format_memory_context(memories, token_budget=None):
+    """Builds the memory block for prompts, keeping it within token_budget."""
+    budget = MEMORY_CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    ordered = [key for key in PRIORITY_FACTS if key in memories]
+    ordered += [key for key in reversed(memories) if key not in PRIORITY_FACTS]
 
-def inject_memories(prompt):
-    memories = load_memories()
     memory_lines = []
-    
-    for k, v in memories.items():
-        if isinstance(v, list):
-            formatted_value = ", ".join(v)
-            memory_lines.append(f"{k.replace('_', ' ').capitalize()}: {formatted_value}")
-        else:
-            memory_lines.append(f"{k.replace('_', ' ').capitalize()}: {v}")
-            
-    memory_context = "\n".join(memory_lines)
+    used = 0
+    for key in ordered:
+        line = _format_fact(key, memories[key])
+        cost = len(line) // 4 + 1
+        if used + cost > budget:
+            continue
+        memory_lines.append(line)
+        used += cost
+    return "\n".join(memory_lines)
+
+def get_memory_context():
+    with _lock:
+        _load_cached()
+        return _cache["context"]
+
+def inject_memories(prompt):
+    memory_context = get_memory_context()
 
     return f"Here is what you remember about the user:\n{memory_context}\n\nUser said: {prompt}"
 
@@ -85,25 +161,31 @@ def handle_get_memories():
 def handle_extract_facts_api(text):
     return extract_facts(text)
 
+# Simple sentiment analysis and emergency detection
+# In a real application, this would use more sophisticated NLP
+ANALYZE_TEXT_LEXICON = {
+    "negative": ["sad", "depressed", "anxious", "worried", "pain", "hurt",
+                 "bad", "terrible", "awful", "miserable", "unhappy"],
+    "positive": ["happy", "good", "great", "wonderful", "joy", "excited",
+                 "pleased", "delighted", "content", "calm", "relaxed"],
+    "confusion": ["confused", "can't remember", "forgot", "don't know",
+                  "unsure", "uncertain", "disoriented", "lost"],
+    "emergency": ["emergency", "help", "fallen", "can't breathe", "chest pain",
+                  "severe", "dizzy", "faint", "ambulance"],
+}
+analyze_text_matcher = ReloadableKeywordMatcher(
+    ANALYZE_TEXT_LEXICON,
+    path=os.environ.get("MEMORY_LEXICON_FILE")
+)
+
 def handle_analyze_text(text):
-    # Simple sentiment analysis and emergency detection
-    # In a real application, this would use more sophisticated NLP
-    negative_words = ["sad", "depressed", "anxious", "worried", "pain", "hurt", 
-                      "bad", "terrible", "awful", "miserable", "unhappy"]
-    positive_words = ["happy", "good", "great", "wonderful", "joy", "excited", 
-                      "pleased", "delighted", "content", "calm", "relaxed"]
-    confusion_words = ["confused", "can't remember", "forgot", "don't know", 
-                       "unsure", "uncertain", "disoriented", "lost"]
-    emergency_words = ["emergency", "help", "fallen", "can't breathe", "chest pain", 
-                       "severe", "dizzy", "faint", "ambulance"]
-    
-    text_lower = text.lower()
+    found = analyze_text_matcher.find_phrases(text)
     
     # Count word instances
-    negative_count = sum(1 for word in negative_words if word in text_lower)
-    positive_count = sum(1 for word in positive_words if word in text_lower)
-    confusion_detected = any(phrase in text_lower for phrase in confusion_words)
-    emergency_detected = any(phrase in text_lower for phrase in emergency_words)
+    negative_count = len(found["negative"])
+    positive_count = len(found["positive"])
+    confusion_detected = len(found["confusion"]) > 0
+    emergency_detected = len(found["emergency"]) > 0
     
     sentiment = "neutral"
     if positive_count > negative_count:
@@ -115,4 +197,4 @@ def handle_analyze_text(text):
         "sentiment": sentiment,
         "confusion_detected": confusion_detected,
         "emergency_detected": emergency_detected
-    }
\ No newline at end of file
+    }
@@ -1,4 +1,7 @@
-from textblob import TextBlob
+import os
+
+from services.keyword_matcher import ReloadableKeywordMatcher
+from services import sentiment_scorer
 
 CONFUSION_KEYWORDS = [
     "where am i", "what time", "who are you", "what day",
@@ -9,19 +12,19 @@ EMERGENCY_KEYWORDS = [
     "help me", "emergency", "call someone", "i fell", "i need help", "i'm hurt"
 ]
 
+keyword_matcher = ReloadableKeywordMatcher(
+    {"confusion": CONFUSION_KEYWORDS, "emergency": EMERGENCY_KEYWORDS},
+    path=os.environ.get("COGNITIVE_LEXICON_FILE")
+)
+
 def analyze_text(user_text):
-    text_lower = user_text.lower()
+    found = keyword_matcher.find_phrases(user_text)
 
-    confusion_flags = [kw for kw in CONFUSION_KEYWORDS if kw in text_lower]
-    emergency_flags = [kw for kw in EMERGENCY_KEYWORDS if kw in text_lower]
+    confusion_flags = found["confusion"]
+    emergency_flags = found["emergency"]
 
-    blob = TextBlob(user_text)
-    polarity = blob.sentiment.polarity
-    sentiment = "neutral"
-    if polarity > 0.2:
-        sentiment = "positive"
-    elif polarity < -0.2:
-        sentiment = "negative"
+    polarity = sentiment_scorer.polarity(user_text)
+    sentiment = sentiment_scorer.classify(polarity)
 
     return {
         "confusion_detected": len(confusion_flags) > 0,
@@ -31,3 +34,10 @@ def analyze_text(user_text):
         "sentiment": sentiment,
         "polarity": polarity
     }
+
+def score_sentiments(texts):
+    # Batch scoring for historical transcripts (mood-trend reports)
+    return [
+        {"sentiment": sentiment_scorer.classify(polarity), "polarity": polarity}
+        for polarity in sentiment_scorer.polarity_batch(texts)
+    ]
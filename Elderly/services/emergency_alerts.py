@@ -0,0 +1,131 @@
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+import logging
+from datetime import datetime
+
+from services.cognitive_monitor import keyword_matcher
+
+logger = logging.getLogger(__name__)
+
+ALERT_LOG_FILE = "output/emergency_alerts.jsonl"
+os.makedirs("output", exist_ok=True)
+
+class LocalAlertNotifier:
+    """Stand-in notifier: logs the alert and appends it to a local JSON Lines file.
+
+    Replace with anything exposing notify(alert) (SMS gateway, pager, nurse
+    call system) via set_notifier().
+    """
+
+    def __init__(self, path=ALERT_LOG_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def notify(self, alert):
+        logger.warning(f"EMERGENCY ALERT ({alert['source']}): {', '.join(alert['phrases'])} - \"{alert['text']}\"")
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(alert) + "\n")
+
+class EmergencyDetector:
+    """Matches emergency phrases and dispatches alerts on a dedicated thread.
+
+    Matching only runs the keyword automaton, so it can be applied to every
+    partial recognizer result without waiting for sentiment analysis or the
+    LLM. Delivery happens off the caller's thread so a slow notifier never
+    holds up transcription.
+    """
+
+    def __init__(self, matcher, notifier):
+        self.matcher = matcher
+        self.notifier = notifier
+        self._alerts = queue.Queue()
+        self._lock = threading.Lock()
+        self.raised = 0
+        self.delivered = 0
+        self.failed = 0
+        self.total_delivery = 0.0
+        self.max_delivery = 0.0
+        threading.Thread(target=self._run, name="emergency-notifier", daemon=True).start()
+
+    def match(self, text):
+        phrases = []
+        for match in self.matcher.scan(text):
+            if match["category"] == "emergency" and match["phrase"] not in phrases:
+                phrases.append(match["phrase"])
+        return phrases
+
+    def check(self, text, source, session_id=None, seen=None):
+        """Raises an alert if text contains emergency phrases not already in seen."""
+        phrases = [phrase for phrase in self.match(text) if not seen or phrase not in seen]
+        if not phrases:
+            return None
+        if seen is not None:
+            seen.update(phrases)
+
+        alert = {
+            "id": str(uuid.uuid4()),
+            "timestamp": datetime.now().isoformat(),
+            "source": source,
+            "session_id": session_id,
+            "phrases": phrases,
+            "text": text
+        }
+        with self._lock:
+            self.raised += 1
+        self._alerts.put((alert, time.monotonic()))
+        return alert
+
+    def watch(self, source, session_id=None):
+        return EmergencyWatch(self, source, session_id or str(uuid.uuid4()))
+
+    def _run(self):
+        while True:
+            alert, raised_at = self._alerts.get()
+            try:
+                self.notifier.notify(alert)
+                latency = time.monotonic() - raised_at
+                with self._lock:
+                    self.delivered += 1
+                    self.total_delivery += latency
+                    self.max_delivery = max(self.max_delivery, latency)
+            except Exception as e:
+                logger.error(f"Failed to deliver emergency alert {alert['id']}: {str(e)}")
+                with self._lock:
+                    self.failed += 1
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "raised": self.raised,
+                "delivered": self.delivered,
+                "failed": self.failed,
+                "pending": self._alerts.qsize(),
+                "avg_delivery_ms": round(self.total_delivery / self.delivered * 1000, 2) if self.delivered else 0.0,
+                "max_delivery_ms": round(self.max_delivery * 1000, 2)
+            }
+
+class EmergencyWatch:
+    """Per-utterance checker: alerts at most once per phrase as partial results grow."""
+
+    def __init__(self, detector, source, session_id):
+        self.detector = detector
+        self.source = source
+        self.session_id = session_id
+        self.seen = set()
+        self.alerts = []
+
+    def check(self, text):
+        alert = self.detector.check(text, self.source, self.session_id, seen=self.seen)
+        if alert:
+            self.alerts.append(alert)
+        return alert
+
+emergency_detector = EmergencyDetector(keyword_matcher, LocalAlertNotifier())
+
+def set_notifier(notifier):
+    emergency_detector.notifier = notifier
@@ -1,14 +1,120 @@
 import json
 import os
+import atexit
+import bisect
+import threading
 from datetime import datetime
 
-LOG_FILE = "output/event_log.json"
+LOG_FILE = "output/event_log.jsonl"
+LEGACY_LOG_FILE = "output/event_log.json"
+FLUSH_INTERVAL = 0.5  # seconds between background flushes
+FLUSH_BATCH_SIZE = 100  # flush early once this many events are pending
 os.makedirs("output", exist_ok=True)
 
-# Ensure log file exists
-if not os.path.exists(LOG_FILE):
-    with open(LOG_FILE, "w") as f:
-        json.dump([], f)
+class EventLog:
+    """Append-only JSON Lines event log with an in-memory time index.
+
+    Events are buffered and appended to disk in batches by a background
+    thread, so logging never rewrites earlier entries. The index maps each
+    entry's timestamp to its byte offset, which lets range queries seek
+    straight to the first matching line.
+    """
+
+    def __init__(self, path=LOG_FILE, legacy_path=LEGACY_LOG_FILE):
+        self.path = path
+        self._times = []
+        self._offsets = []
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._file_lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+        if not os.path.exists(path):
+            self._migrate(legacy_path)
+        self._build_index()
+
+        self._flusher = threading.Thread(target=self._run_flusher, name="event-log-flusher", daemon=True)
+        self._flusher.start()
+        atexit.register(self.flush)
+
+    def _migrate(self, legacy_path):
+        # Carry over entries from the old whole-file JSON log
+        entries = []
+        if legacy_path and os.path.exists(legacy_path):
+            with open(legacy_path, "r") as f:
+                entries = json.load(f)
+        with open(self.path, "w") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+
+    def _build_index(self):
+        offset = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # partial entry from a crash mid-flush
+                if line.strip():
+                    self._times.append(json.loads(line).get("timestamp", ""))
+                    self._offsets.append(offset)
+                offset += len(line)
+        if offset < os.path.getsize(self.path):
+            # Drop the torn tail so the next flush starts on a fresh line
+            os.truncate(self.path, offset)
+
+    def _run_flusher(self):
+        while True:
+            self._wakeup.wait(FLUSH_INTERVAL)
+            self._wakeup.clear()
+            self.flush()
+
+    def append(self, entry):
+        with self._pending_lock:
+            self._pending.append(entry)
+            if len(self._pending) >= FLUSH_BATCH_SIZE:
+                self._wakeup.set()
+
+    def flush(self):
+        with self._file_lock:
+            with self._pending_lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return
+            with open(self.path, "ab") as f:
+                offset = f.seek(0, os.SEEK_END)
+                for entry in batch:
+                    line = (json.dumps(entry) + "\n").encode("utf-8")
+                    f.write(line)
+                    self._times.append(entry["timestamp"])
+                    self._offsets.append(offset)
+                    offset += len(line)
+
+    def query(self, since=None, until=None, limit=None):
+        # Entries are appended in time order, so the index is already sorted
+        self.flush()
+        with self._file_lock:
+            start = bisect.bisect_left(self._times, _as_timestamp(since)) if since else 0
+            end = bisect.bisect_right(self._times, _as_timestamp(until)) if until else len(self._times)
+            if limit is not None:
+                # Keep the most recent entries within the range
+                start = max(start, end - limit)
+            if start >= end:
+                return []
+
+            entries = []
+            with open(self.path, "rb") as f:
+                f.seek(self._offsets[start])
+                for _ in range(end - start):
+                    entries.append(json.loads(f.readline()))
+            return entries
+
+    def __len__(self):
+        with self._pending_lock:
+            return len(self._times) + len(self._pending)
+
+def _as_timestamp(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+event_log = EventLog()
 
 def log_event(sentiment, confusion, emergency):
     timestamp = datetime.now().isoformat()
@@ -18,15 +124,12 @@ def log_event(sentiment, confusion, emergency):
         "confusion": confusion,
         "emergency": emergency
     }
+    event_log.append(entry)
 
-    with open(LOG_FILE, "r") as f:
-        data = json.load(f)
-
-    data.append(entry)
-
-    with open(LOG_FILE, "w") as f:
-        json.dump(data, f, indent=2)
+def get_logs(since=None, until=None, limit=None):
+    """Returns logged events with since <= timestamp <= until, oldest first.
 
-def get_logs():
-    with open(LOG_FILE, "r") as f:
-        return json.load(f)
+    since/until may be datetimes or ISO strings; limit keeps the most recent
+    matching entries.
+    """
+    return event_log.query(since=since, until=until, limit=limit)
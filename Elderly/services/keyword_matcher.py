@@ -0,0 +1,141 @@
+import json
+import os
+import threading
+import time
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+LEXICON_CHECK_INTERVAL = 5.0  # seconds between lexicon file mtime checks
+
+def normalize(text):
+    # Same length as the input, so match offsets line up with the original text
+    return text.lower().replace("’", "'")
+
+class KeywordMatcher:
+    """Aho-Corasick automaton over categorized keyword phrases.
+
+    All phrases are compiled into one trie with failure links, so a text is
+    scanned once no matter how many phrases there are. Matches must start and
+    end on word boundaries ("help" does not match inside "helpful").
+    """
+
+    def __init__(self, lexicon):
+        self.lexicon = {category: list(phrases) for category, phrases in lexicon.items()}
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for category, phrases in self.lexicon.items():
+            for phrase in phrases:
+                self._add(category, normalize(phrase).strip())
+        self._link()
+
+    def _add(self, category, phrase):
+        if not phrase:
+            return
+        node = 0
+        for ch in phrase:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        if (category, phrase) not in self._out[node]:
+            self._out[node].append((category, phrase))
+
+    def _link(self):
+        # Breadth-first so every node's failure target is finished before its children
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fallback = self._fail[node]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def scan(self, text):
+        """Returns [{"category", "phrase", "start", "end"}] for every match, in text order."""
+        text = normalize(text)
+        goto, fail, out = self._goto, self._fail, self._out
+        matches = []
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if not out[node]:
+                continue
+            end = i + 1
+            for category, phrase in out[node]:
+                start = end - len(phrase)
+                if start > 0 and text[start - 1].isalnum():
+                    continue
+                if end < len(text) and text[end].isalnum():
+                    continue
+                matches.append({"category": category, "phrase": phrase, "start": start, "end": end})
+        return matches
+
+    def find_phrases(self, text):
+        """Returns {category: [distinct matched phrases]} with every category present."""
+        found = {category: [] for category in self.lexicon}
+        for match in self.scan(text):
+            phrases = found[match["category"]]
+            if match["phrase"] not in phrases:
+                phrases.append(match["phrase"])
+        return found
+
+class ReloadableKeywordMatcher:
+    """KeywordMatcher whose lexicon can be extended from a JSON file.
+
+    The file maps category -> list of phrases and replaces the built-in list
+    for each category it names. It is re-read whenever its mtime changes, so
+    lexicons can be edited without restarting the app.
+    """
+
+    def __init__(self, defaults, path=None, check_interval=LEXICON_CHECK_INTERVAL):
+        self.defaults = defaults
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked_at = 0.0
+        self._matcher = KeywordMatcher(defaults)
+        self._maybe_reload()
+
+    def _maybe_reload(self):
+        if not self.path:
+            return
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval and self._mtime is not None:
+            return
+        with self._lock:
+            self._checked_at = now
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except FileNotFoundError:
+                return
+            if mtime == self._mtime:
+                return
+            try:
+                with open(self.path, "r") as f:
+                    lexicon = {**self.defaults, **json.load(f)}
+                self._matcher = KeywordMatcher(lexicon)
+                logger.info(f"Loaded keyword lexicon from {self.path}")
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not load keyword lexicon {self.path}: {str(e)}")
+            self._mtime = mtime
+
+    def scan(self, text):
+        self._maybe_reload()
+        return self._matcher.scan(text)
+
+    def find_phrases(self, text):
+        self._maybe_reload()
+        return self._matcher.find_phrases(text)
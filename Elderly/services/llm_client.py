@@ -0,0 +1,191 @@
+import json
+import os
+import logging
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Shared client for every call to the local Ollama server
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434")
+OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", "mistral")
+OLLAMA_CONNECT_TIMEOUT = float(os.environ.get("OLLAMA_CONNECT_TIMEOUT", "5"))
+OLLAMA_READ_TIMEOUT = float(os.environ.get("OLLAMA_READ_TIMEOUT", "30"))
+OLLAMA_MAX_RETRIES = int(os.environ.get("OLLAMA_MAX_RETRIES", "2"))
+OLLAMA_RETRY_BACKOFF = float(os.environ.get("OLLAMA_RETRY_BACKOFF", "0.5"))
+OLLAMA_MAX_CONCURRENCY = int(os.environ.get("OLLAMA_MAX_CONCURRENCY", "4"))
+# How long Ollama keeps the model (and its prompt cache) loaded after a request
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+
+# Only failures where Ollama didn't start on the request are retried
+RETRYABLE_STATUS = {429, 503}
+
+
+class LLMMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.streams = 0
+        self.total_first_token = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def record_call(self, latency, result=None):
+        with self._lock:
+            self.calls += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            if result:
+                self.prompt_tokens += result.get("prompt_eval_count", 0)
+                self.completion_tokens += result.get("eval_count", 0)
+
+    def record_first_token(self, latency):
+        with self._lock:
+            self.streams += 1
+            self.total_first_token += latency
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "retries": self.retries,
+                "avg_latency_ms": round(self.total_latency / self.calls * 1000, 2) if self.calls else 0.0,
+                "max_latency_ms": round(self.max_latency * 1000, 2),
+                "avg_first_token_ms": round(self.total_first_token / self.streams * 1000, 2) if self.streams else 0.0,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+            }
+
+
+metrics = LLMMetrics()
+
+_session = requests.Session()
+_session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=OLLAMA_MAX_CONCURRENCY))
+_session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=OLLAMA_MAX_CONCURRENCY))
+_slots = threading.BoundedSemaphore(OLLAMA_MAX_CONCURRENCY)
+
+
+def _post(path, payload, timeout=None, stream=False):
+    # Keep-alive POST with bounded concurrency and retries on transient failures.
+    # A streamed response keeps its concurrency slot until the caller releases it.
+    timeout = timeout or (OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT)
+    attempt = 0
+    while True:
+        _slots.acquire()
+        try:
+            response = _session.post(f"{OLLAMA_URL}{path}", json=payload, timeout=timeout, stream=stream)
+            response.raise_for_status()
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.HTTPError) as e:
+            _slots.release()
+            status = e.response.status_code if e.response is not None else None
+            if e.response is not None:
+                e.response.close()
+            if status is not None:
+                retryable = status in RETRYABLE_STATUS
+            else:
+                # A read timeout means the server is busy generating; resending would add load
+                retryable = not isinstance(e, requests.exceptions.ReadTimeout)
+            if not retryable or attempt >= OLLAMA_MAX_RETRIES:
+                metrics.record_error()
+                raise
+            metrics.record_retry()
+            delay = OLLAMA_RETRY_BACKOFF * (2 ** attempt)
+            logger.warning(f"Ollama request failed ({e}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+            continue
+        except Exception:
+            _slots.release()
+            raise
+        if not stream:
+            _slots.release()
+        return response
+
+
+def generate_raw(prompt, model=None, options=None, timeout=None, **extra):
+    payload = {
+        "model": model or OLLAMA_MODEL,
+        "prompt": prompt,
+        "stream": False,
+    }
+    if options:
+        payload["options"] = options
+    if OLLAMA_KEEP_ALIVE:
+        payload["keep_alive"] = OLLAMA_KEEP_ALIVE
+    payload.update(extra)
+
+    start = time.monotonic()
+    result = _post("/api/generate", payload, timeout=timeout).json()
+    metrics.record_call(time.monotonic() - start, result)
+    return result
+
+
+def generate(prompt, model=None, options=None, timeout=None, **extra):
+    return generate_raw(prompt, model=model, options=options, timeout=timeout, **extra).get("response", "").strip()
+
+
+def generate_stream(prompt, model=None, options=None, timeout=None, on_done=None, **extra):
+    # Yields response tokens as Ollama produces them; on_done gets the final chunk
+    # (token counts, context) once the stream completes
+    payload = {
+        "model": model or OLLAMA_MODEL,
+        "prompt": prompt,
+        "stream": True,
+    }
+    if options:
+        payload["options"] = options
+    if OLLAMA_KEEP_ALIVE:
+        payload["keep_alive"] = OLLAMA_KEEP_ALIVE
+    payload.update(extra)
+
+    start = time.monotonic()
+    response = _post("/api/generate", payload, timeout=timeout, stream=True)
+    result = None
+    first_token = True
+    try:
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get("error"):
+                # Ollama reports failures after the headers as an error line
+                metrics.record_error()
+                raise RuntimeError(f"Ollama stream failed: {chunk['error']}")
+            token = chunk.get("response", "")
+            if token:
+                if first_token:
+                    metrics.record_first_token(time.monotonic() - start)
+                    first_token = False
+                yield token
+            if chunk.get("done"):
+                result = chunk
+                if on_done:
+                    on_done(chunk)
+                break
+        else:
+            metrics.record_error()
+            raise RuntimeError("Ollama stream ended before the reply was done")
+    finally:
+        response.close()
+        _slots.release()
+        metrics.record_call(time.monotonic() - start, result)
+
+
+def get_metrics():
+    return metrics.snapshot()
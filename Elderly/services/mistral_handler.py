@@ -1,34 +1,46 @@
 import requests
 import logging
 
+from services import llm_client
+
 logger = logging.getLogger(__name__)
 
+# Instructions come before the user's words so every request shares the same
+# prompt prefix, which Ollama can serve from its cache while the model stays loaded
 ELDERLY_PROMPT = """You are a kind and thoughtful companion for an elderly person.
+Respond in a warm, gentle, and friendly way. Keep it short and caring.
 They just said: "{input}"
-Respond in a warm, gentle, and friendly way. Keep it short and caring."""
+"""
+
+def _error_reply(error):
+    if isinstance(error, requests.exceptions.HTTPError):
+        logger.error(f"Error from Mistral API: {error.response.status_code} - {error.response.text}")
+    elif isinstance(error, requests.exceptions.ConnectionError):
+        logger.error("Could not connect to Ollama server. Make sure it's running.")
+        return "I'm here for you, but I'm having trouble connecting to my thinking system."
+    else:
+        logger.error(f"Error getting AI response: {str(error)}")
+    return "I'm here for you, but something went wrong getting my thoughts."
 
 def get_ai_response(user_text):
     try:
         prompt = ELDERLY_PROMPT.format(input=user_text)
+        return llm_client.generate(prompt)
+    except Exception as e:
+        return _error_reply(e)
 
-        response = requests.post(
-            "http://localhost:11434/api/generate",  # Ollama default port
-            json={
-                "model": "mistral",  # name of your pulled model
-                "prompt": prompt,
-                "stream": False
-            },
-            timeout=30
-        )
-
-        if response.status_code == 200:
-            return response.json()["response"].strip()
-        else:
-            logger.error(f"Error from Mistral API: {response.status_code} - {response.text}")
-            return "I'm here for you, but something went wrong getting my thoughts."
-    except requests.exceptions.ConnectionError:
-        logger.error("Could not connect to Ollama server. Make sure it's running.")
-        return "I'm here for you, but I'm having trouble connecting to my thinking system."
+def stream_ai_response(user_text):
+    # Yields the reply token by token; falls back to a canned reply if nothing was
+    # generated, and re-raises if the stream breaks partway so callers don't treat
+    # a cut-off reply as complete
+    produced = False
+    try:
+        prompt = ELDERLY_PROMPT.format(input=user_text)
+        for token in llm_client.generate_stream(prompt):
+            produced = True
+            yield token
     except Exception as e:
-        logger.error(f"Error getting AI response: {str(e)}")
-        return "I'm here for you, but something went wrong getting my thoughts."
+        reply = _error_reply(e)
+        if produced:
+            raise
+        yield reply
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import threading
+from collections import deque
+
+DEFAULT_PARTITION = "default"
+DEFAULT_WINDOW_SIZE = 50
+
+class _Partition:
+    def __init__(self, path, window_size):
+        self.path = path
+        self.lock = threading.Lock()
+        self.offsets = []
+        self.window = deque(maxlen=window_size)
+        self.end = 0
+
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # partial record from a crash mid-append
+                    if line.strip():
+                        self.offsets.append(self.end)
+                        self.window.append(json.loads(line))
+                    self.end += len(line)
+            if self.end < os.path.getsize(path):
+                # Drop the torn tail so the next append starts on a fresh line
+                os.truncate(path, self.end)
+
+class RecordStore:
+    """Append-only JSON Lines store, one file per user/device partition.
+
+    Every record is written to disk as soon as it is added, only the most
+    recent window_size records per partition are kept in memory, and older
+    records are read back a page at a time using a per-partition line index.
+    """
+
+    def __init__(self, directory, window_size=DEFAULT_WINDOW_SIZE, legacy_file=None):
+        self.directory = directory
+        self.window_size = window_size
+        self._partitions = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        if legacy_file:
+            self._migrate(legacy_file)
+
+    def _migrate(self, legacy_file):
+        # Move records from the old single-file JSON dump into the default partition
+        path = self._path(None)
+        if os.path.exists(path) or not os.path.exists(legacy_file):
+            return
+        with open(legacy_file, "r") as f:
+            records = json.load(f)
+        with open(path, "w") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+
+    def _path(self, key):
+        # Ids are hashed so distinct ids never share a file (sanitizing or a
+        # case-insensitive filesystem would merge e.g. "john.doe" and "john_doe")
+        name = hashlib.sha256(key.encode("utf-8")).hexdigest() if key else DEFAULT_PARTITION
+        return os.path.join(self.directory, f"{name}.jsonl")
+
+    def _partition(self, key):
+        key = key or None
+        with self._lock:
+            partition = self._partitions.get(key)
+            if partition is None:
+                partition = _Partition(self._path(key), self.window_size)
+                self._partitions[key] = partition
+            return partition
+
+    def append(self, key, *records):
+        partition = self._partition(key)
+        with partition.lock:
+            with open(partition.path, "ab") as f:
+                for record in records:
+                    line = (json.dumps(record) + "\n").encode("utf-8")
+                    f.write(line)
+                    partition.offsets.append(partition.end)
+                    partition.window.append(record)
+                    partition.end += len(line)
+
+    def recent(self, key, count=None):
+        partition = self._partition(key)
+        with partition.lock:
+            records = list(partition.window)
+        return records[-count:] if count else records
+
+    def count(self, key):
+        partition = self._partition(key)
+        with partition.lock:
+            return len(partition.offsets)
+
+    def page(self, key, offset=0, limit=DEFAULT_WINDOW_SIZE):
+        """Returns (records, total) for records offset..offset+limit, oldest first."""
+        partition = self._partition(key)
+        with partition.lock:
+            total = len(partition.offsets)
+            start = max(0, offset)
+            end = min(total, start + max(0, limit))
+            if start >= end:
+                return [], total
+
+            # Serve from the in-memory window when the page falls inside it
+            window_start = total - len(partition.window)
+            if start >= window_start:
+                window = list(partition.window)
+                return window[start - window_start:end - window_start], total
+
+            records = []
+            with open(partition.path, "rb") as f:
+                f.seek(partition.offsets[start])
+                for _ in range(end - start):
+                    records.append(json.loads(f.readline()))
+            return records, total
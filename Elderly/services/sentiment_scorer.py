@@ -0,0 +1,96 @@
+import os
+import threading
+import logging
+from collections import OrderedDict
+
+from textblob import TextBlob
+
+logger = logging.getLogger(__name__)
+
+SENTIMENT_CACHE_SIZE = int(os.environ.get("SENTIMENT_CACHE_SIZE", "4096"))
+
+class _LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def info(self):
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+_cache = _LRUCache(SENTIMENT_CACHE_SIZE)
+
+def _score(text):
+    return TextBlob(text).sentiment.polarity
+
+def polarity(text):
+    """TextBlob polarity for text, memoized for repeated utterances."""
+    text = text.strip()
+    value = _cache.get(text)
+    if value is None:
+        value = _score(text)
+        _cache.put(text, value)
+    return value
+
+def classify(value):
+    sentiment = "neutral"
+    if value > 0.2:
+        sentiment = "positive"
+    elif value < -0.2:
+        sentiment = "negative"
+    return sentiment
+
+def polarity_batch(texts):
+    """Scores many texts at once, e.g. for mood-trend reports.
+
+    Duplicate texts are scored once and cached results are reused. Scoring
+    stays in-process: worker processes would re-import app.py on spawn
+    platforms and load the Vosk model and service threads in each one.
+    """
+    texts = [text.strip() for text in texts]
+    scores = {}
+    missing = []
+    for text in dict.fromkeys(texts):
+        value = _cache.get(text)
+        if value is None:
+            missing.append(text)
+        else:
+            scores[text] = value
+
+    for text in missing:
+        value = _score(text)
+        _cache.put(text, value)
+        scores[text] = value
+    return [scores[text] for text in texts]
+
+def warm_up():
+    # TextBlob loads its lexicon lazily on first use; do it before the first request
+    try:
+        _score("Warming up the sentiment lexicon.")
+    except Exception as e:
+        logger.error(f"Could not preload sentiment lexicon: {str(e)}")
+
+def start_warm_up():
+    threading.Thread(target=warm_up, name="sentiment-warm-up", daemon=True).start()
+
+def cache_info():
+    return _cache.info()
@@ -1,26 +1,196 @@
 from vosk import Model, KaldiRecognizer
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time
 import wave
 import json
 
+# Bytes of 16-bit mono PCM fed to the recognizer per step (4000 frames)
+CHUNK_BYTES = 8000
+
+STT_WORKERS = int(os.environ.get('STT_WORKERS', os.cpu_count() or 2))
+MAX_IDLE_RECOGNIZERS = int(os.environ.get('STT_MAX_IDLE_RECOGNIZERS', STT_WORKERS))
+
+class RecognizerPool:
+    """Reusable KaldiRecognizer instances, kept per sample rate.
+
+    Building a recognizer allocates decoder state for the model, so finished
+    recognizers are Reset() and handed to the next utterance instead.
+    """
+
+    def __init__(self, model, max_idle_per_rate=MAX_IDLE_RECOGNIZERS):
+        self.model = model
+        self.max_idle_per_rate = max_idle_per_rate
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self, sample_rate):
+        with self._lock:
+            idle = self._idle.get(sample_rate)
+            if idle:
+                self.reused += 1
+                return idle.pop()
+            self.created += 1
+        return KaldiRecognizer(self.model, sample_rate)
+
+    def release(self, sample_rate, recognizer):
+        recognizer.Reset()
+        with self._lock:
+            idle = self._idle.setdefault(sample_rate, [])
+            if len(idle) < self.max_idle_per_rate:
+                idle.append(recognizer)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'created': self.created,
+                'reused': self.reused,
+                'idle': {rate: len(idle) for rate, idle in self._idle.items()}
+            }
+
+class TranscriptionStream:
+    """Incremental transcription of raw 16-bit mono PCM.
+
+    Feed audio with accept() as it arrives; each call returns an event dict
+    ({"type": "partial" | "result", "text": ...}) or None when nothing new
+    was recognized. finish() flushes the recognizer and returns the full text.
+    """
+
+    def __init__(self, recognizer, on_close=None):
+        self.recognizer = recognizer
+        self.results = []
+        self._last_partial = ""
+        self._on_close = on_close
+
+    def accept(self, data):
+        if not data:
+            return None
+        if self.recognizer.AcceptWaveform(data):
+            text = json.loads(self.recognizer.Result()).get("text", "")
+            self.results.append(text)
+            self._last_partial = ""
+            return {"type": "result", "text": text}
+
+        partial = json.loads(self.recognizer.PartialResult()).get("partial", "")
+        if partial and partial != self._last_partial:
+            self._last_partial = partial
+            return {"type": "partial", "text": partial}
+        return None
+
+    def transcript(self):
+        return " ".join(text for text in self.results if text)
+
+    def finish(self):
+        final = json.loads(self.recognizer.FinalResult())
+        self.results.append(final.get("text", ""))
+        self.close()
+        return " ".join(self.results)
+
+    def close(self):
+        # Hands the recognizer back to its pool; safe to call more than once
+        if self._on_close is not None:
+            on_close, self._on_close = self._on_close, None
+            on_close(self.recognizer)
+
 class STTService:
-    def __init__(self, model_path):
+    def __init__(self, model_path, max_workers=STT_WORKERS):
         self.model = Model(model_path)
+        self.recognizers = RecognizerPool(self.model)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stt")
+        self.max_workers = max_workers
+        self._metrics_lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._completed = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def create_stream(self, sample_rate):
+        recognizer = self.recognizers.acquire(sample_rate)
+        return TranscriptionStream(
+            recognizer,
+            on_close=lambda rec: self.recognizers.release(sample_rate, rec)
+        )
+
+    def stream_transcribe(self, chunks, sample_rate):
+        # Yields partial/result events while audio is still arriving, then a final event
+        stream = self.create_stream(sample_rate)
+        try:
+            pending = b""
+            for chunk in chunks:
+                pending += chunk
+                # Keep sample boundaries intact: 16-bit PCM needs an even byte count
+                usable = len(pending) - (len(pending) % 2)
+                if usable == 0:
+                    continue
+                event = stream.accept(pending[:usable])
+                pending = pending[usable:]
+                if event:
+                    if event["type"] == "result":
+                        event["transcription"] = stream.transcript()
+                    yield event
+            transcription = stream.finish().strip()
+            yield {"type": "final", "text": transcription, "transcription": transcription}
+        finally:
+            stream.close()
+
+    def transcribe(self, audio_path, on_text=None):
+        # on_text, if given, sees every partial and segment result as it is recognized,
+        # and the final flushed segment at the end
+        with wave.open(audio_path, "rb") as wf:
+            if wf.getnchannels() != 1 or wf.getsampwidth() != 2 or wf.getcomptype() != "NONE":
+                raise ValueError("Audio file must be WAV format Mono PCM.")
+
+            stream = self.create_stream(wf.getframerate())
+            try:
+                while True:
+                    data = wf.readframes(4000)
+                    if len(data) == 0:
+                        break
+                    event = stream.accept(data)
+                    if event and on_text:
+                        on_text(event["text"])
+                transcription = stream.finish()
+                # The recognizer's final flush can hold words no earlier event carried
+                if on_text and stream.results[-1]:
+                    on_text(stream.results[-1])
+                return transcription
+            finally:
+                stream.close()
+
+    def submit(self, audio_path, on_text=None):
+        # Queues a transcription on the worker pool and returns a Future
+        enqueued_at = time.monotonic()
+        with self._metrics_lock:
+            self._queued += 1
+        return self.executor.submit(self._run_job, audio_path, enqueued_at, on_text)
+
+    def _run_job(self, audio_path, enqueued_at, on_text=None):
+        wait = time.monotonic() - enqueued_at
+        with self._metrics_lock:
+            self._queued -= 1
+            self._active += 1
+            self._total_wait += wait
+            self._max_wait = max(self._max_wait, wait)
+        try:
+            return self.transcribe(audio_path, on_text=on_text)
+        finally:
+            with self._metrics_lock:
+                self._active -= 1
+                self._completed += 1
 
-    def transcribe(self, audio_path):
-        wf = wave.open(audio_path, "rb")
-        if wf.getnchannels() != 1 or wf.getsampwidth() != 2 or wf.getcomptype() != "NONE":
-            raise ValueError("Audio file must be WAV format Mono PCM.")
-
-        rec = KaldiRecognizer(self.model, wf.getframerate())
-        results = []
-
-        while True:
-            data = wf.readframes(4000)
-            if len(data) == 0:
-                break
-            if rec.AcceptWaveform(data):
-                result = json.loads(rec.Result())
-                results.append(result.get("text", ""))
-        final = json.loads(rec.FinalResult())
-        results.append(final.get("text", ""))
-        return " ".join(results)
+    def metrics(self):
+        with self._metrics_lock:
+            started = self._completed + self._active
+            return {
+                'workers': self.max_workers,
+                'queue_depth': self._queued,
+                'active': self._active,
+                'completed': self._completed,
+                'avg_wait_ms': round(self._total_wait / started * 1000, 2) if started else 0.0,
+                'max_wait_ms': round(self._max_wait * 1000, 2),
+                'recognizers': self.recognizers.stats()
+            }
@@ -1,30 +1,192 @@
 import pyttsx3
 import os
+import re
+import queue
+import hashlib
+import threading
 import logging
+from collections import OrderedDict
+from concurrent.futures import Future
 
 logger = logging.getLogger(__name__)
 
-def synthesize_speech(text, output_path):
-    try:
+TTS_RATE = 160  # Speaking speed
+TTS_VOLUME = 1.0  # Volume (0.0 to 1.0)
+TTS_CACHE_DIR = os.environ.get('TTS_CACHE_DIR', 'cache/tts')
+TTS_CACHE_MAX_BYTES = int(os.environ.get('TTS_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+AUDIO_EXTENSION = '.mp3'
+
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+
+class TTSWorker:
+    """Owns a single pyttsx3 engine on a dedicated thread.
+
+    pyttsx3 engines are not thread-safe and are slow to initialise, so the
+    engine is created once and every synthesis request is queued to it.
+    """
+
+    def __init__(self):
+        self._jobs = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.default_voice = None
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="tts-worker", daemon=True)
+                self._thread.start()
+
+    def _init_engine(self):
         engine = pyttsx3.init()
-        engine.setProperty('rate', 160)  # Speaking speed
-        engine.setProperty('volume', 1.0)  # Volume (0.0 to 1.0)
-        
-        # Get available voices
-        voices = engine.getProperty('voices')
-        
+        engine.setProperty('rate', TTS_RATE)
+        engine.setProperty('volume', TTS_VOLUME)
+
         # Try to set a more natural voice if available
-        for voice in voices:
+        for voice in engine.getProperty('voices'):
             if "female" in voice.name.lower():
-                engine.setProperty('voice', voice.id)
+                self.default_voice = voice.id
                 break
-        
+        return engine
+
+    def _run(self):
+        engine = None
+        while True:
+            text, output_path, voice, rate, future = self._jobs.get()
+            try:
+                if engine is None:
+                    engine = self._init_engine()
+                engine.setProperty('rate', rate or TTS_RATE)
+                if voice or self.default_voice:
+                    engine.setProperty('voice', voice or self.default_voice)
+                engine.save_to_file(text, output_path)
+                engine.runAndWait()
+                future.set_result(True)
+            except Exception as e:
+                future.set_exception(e)
+
+    def synthesize(self, text, output_path, voice=None, rate=None):
+        future = Future()
+        self._ensure_started()
+        self._jobs.put((text, output_path, voice, rate, future))
+        return future.result()
+
+class AudioCache:
+    """Content-addressed LRU cache of synthesized audio files on disk.
+
+    Entries are evicted least-recently-used first once the directory grows
+    past max_bytes.
+    """
+
+    def __init__(self, directory=TTS_CACHE_DIR, max_bytes=TTS_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        # Rebuild the index from disk, oldest access first
+        files = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith('.'):
+                # Leftover partial render from an interrupted synthesis
+                os.remove(path)
+                continue
+            if not name.endswith(AUDIO_EXTENSION):
+                continue
+            stat = os.stat(path)
+            files.append((stat.st_mtime, name[:-len(AUDIO_EXTENSION)], stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._size += size
+
+    @staticmethod
+    def make_key(text, voice=None, rate=None):
+        raw = f"{text}\0{voice or 'default'}\0{rate or TTS_RATE}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.directory, key + AUDIO_EXTENSION)
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._size -= self._entries.pop(key, 0)
+            return None
+        return path
+
+    def put(self, key, source_path):
+        path = self.path_for(key)
+        os.replace(source_path, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            self._size -= self._entries.pop(key, 0)
+            self._entries[key] = size
+            self._size += size
+            evicted = self._evict()
+        for old_key in evicted:
+            try:
+                os.remove(self.path_for(old_key))
+            except FileNotFoundError:
+                pass
+        return path
+
+    def _evict(self):
+        evicted = []
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            old_key, size = self._entries.popitem(last=False)
+            self._size -= size
+            evicted.append(old_key)
+        return evicted
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._size, 'max_bytes': self.max_bytes}
+
+tts_worker = TTSWorker()
+audio_cache = AudioCache()
+
+def split_sentences(text):
+    return [sentence.strip() for sentence in SENTENCE_BOUNDARY.split(text) if sentence.strip()]
+
+def synthesize_cached(text, voice=None, rate=None):
+    """Returns (cache key, audio path) for text, synthesizing it only on a cache miss."""
+    key = AudioCache.make_key(text, voice, rate)
+    path = audio_cache.get(key)
+    if path:
+        return key, path
+
+    # Render next to the cache entry, then move it in atomically
+    tmp_path = os.path.join(audio_cache.directory, f".{key}.{threading.get_ident()}{AUDIO_EXTENSION}")
+    tts_worker.synthesize(text, tmp_path, voice=voice, rate=rate)
+    return key, audio_cache.put(key, tmp_path)
+
+def synthesize_sentences(text, voice=None, rate=None):
+    # Yields (sentence, key, path) one sentence at a time so playback can start early
+    for sentence in split_sentences(text):
+        key, path = synthesize_cached(sentence, voice=voice, rate=rate)
+        yield sentence, key, path
+
+def synthesize_speech(text, output_path):
+    try:
         # Ensure directory exists
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
         
         # Save to file
-        engine.save_to_file(text, output_path)
-        engine.runAndWait()
+        tts_worker.synthesize(text, output_path)
         
         return True
     except Exception as e:
@@ -1,20 +1,13 @@
-from transformers import pipeline
 from openai import OpenAI
-import torch
-import requests
 import os
 
-device = 0 if torch.cuda.is_available() else -1
-sentiment_pipeline = pipeline(
-    "sentiment-analysis",
-    model="distilbert/distilbert-base-uncased-finetuned-sst-2-english",
-    device=device
-)
+import llm_client
+
+from sentiment_engine import analyze_sentiment, analyze_sentiment_batch
 
 
 def analyze_sentiment_with_distilbert(text):
-    result = sentiment_pipeline(text)
-    return result[0]['label'].upper()
+    return analyze_sentiment(text)
 
 def analyze_with_mistral(text):
     prompt = f"""
@@ -30,16 +23,8 @@ Your response should include:
 
 Response:
 """
-    response = requests.post(
-        "http://localhost:11434/api/generate",
-        json={
-            "model": "mistral",
-            "prompt": prompt,
-            "stream": False
-        }
-    )
-    result = response.json()
-    return result["response"].strip().split("Response:")[-1].strip()
+    response = llm_client.generate(prompt)
+    return response.split("Response:")[-1].strip()
 
 def analyze_with_gpt4(text):
     prompt = f"""
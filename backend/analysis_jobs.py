@@ -0,0 +1,163 @@
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from stt_models import transcribe
+from sentiment_engine import sentiment_batcher
+from analysis import analyze_with_gpt4, analyze_with_mistral
+
+ANALYZE_STT_WORKERS = int(os.environ.get("ANALYZE_STT_WORKERS", "1"))  # transcriptions on one model still run one at a time
+ANALYZE_LLM_WORKERS = int(os.environ.get("ANALYZE_LLM_WORKERS", "2"))
+ANALYZE_JOB_TTL = int(os.environ.get("ANALYZE_JOB_TTL", "3600"))  # seconds a finished job stays queryable
+ANALYZE_MAX_JOBS = int(os.environ.get("ANALYZE_MAX_JOBS", "1000"))
+
+STAGES = ("saved", "transcription", "sentiment", "ai_response")
+
+
+class AnalysisJob:
+    def __init__(self, audio_path):
+        self.id = uuid.uuid4().hex
+        self.audio_path = audio_path
+        self.status = "queued"
+        self.results = {}
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.events = []  # (stage, payload) in the order stages completed
+        self._cond = threading.Condition()
+
+    def complete_stage(self, stage, value):
+        with self._cond:
+            self.results[stage] = value
+            if stage == STAGES[-1]:
+                self.status = "done"
+                self.finished_at = time.time()
+            elif stage != STAGES[0]:
+                self.status = "running"
+            self.events.append((stage, {"stage": stage, "value": value}))
+            self._cond.notify_all()
+
+    def fail(self, stage, error):
+        with self._cond:
+            self.status = "failed"
+            self.error = {"stage": stage, "message": str(error)}
+            self.finished_at = time.time()
+            self.events.append(("error", self.error))
+            self._cond.notify_all()
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+    def wait_events(self, start, timeout=None):
+        """Events after index start, blocking until there is at least one or the job ends."""
+        with self._cond:
+            self._cond.wait_for(lambda: len(self.events) > start or self.finished, timeout=timeout)
+            return self.events[start:]
+
+    def wait(self, timeout=None):
+        with self._cond:
+            self._cond.wait_for(lambda: self.finished, timeout=timeout)
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "stages": {stage: stage in self.results for stage in STAGES},
+            "transcription": self.results.get("transcription"),
+            "sentiment": self.results.get("sentiment"),
+            "ai_response": self.results.get("ai_response"),
+            "error": self.error
+        }
+
+
+class AnalysisPipeline:
+    """Runs /analyze jobs as a staged pipeline.
+
+    Transcription and generation have their own worker pools, so Whisper can
+    start on the next upload while the LLM is still answering the previous
+    one. Sentiment goes through the shared DistilBERT micro-batcher and hands
+    off to the LLM pool from its callback, without holding a thread.
+    """
+
+    def __init__(self, stt_workers=ANALYZE_STT_WORKERS, llm_workers=ANALYZE_LLM_WORKERS,
+                 ttl=ANALYZE_JOB_TTL, max_jobs=ANALYZE_MAX_JOBS):
+        self._stt = ThreadPoolExecutor(max_workers=stt_workers, thread_name_prefix="analyze-stt")
+        self._llm = ThreadPoolExecutor(max_workers=llm_workers, thread_name_prefix="analyze-llm")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+
+    def submit(self, audio_path):
+        job = AnalysisJob(audio_path)
+        with self._lock:
+            self._evict()
+            self._jobs[job.id] = job
+        job.complete_stage("saved", True)
+        self._stt.submit(self._transcribe, job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _evict(self):
+        # Finished jobs expire after the TTL, oldest first if over capacity
+        cutoff = time.time() - self.ttl
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished]:
+            if len(self._jobs) < self.max_jobs and self._jobs[job_id].finished_at > cutoff:
+                continue
+            del self._jobs[job_id]
+
+    def _transcribe(self, job):
+        try:
+            transcription = transcribe(job.audio_path)["text"]
+        except Exception as e:
+            job.fail("transcription", e)
+            return
+        finally:
+            os.remove(job.audio_path)
+        job.complete_stage("transcription", transcription)
+        sentiment_batcher.submit(transcription).add_done_callback(
+            lambda future: self._after_sentiment(job, transcription, future)
+        )
+
+    def _after_sentiment(self, job, transcription, future):
+        try:
+            sentiment = future.result()
+        except Exception as e:
+            job.fail("sentiment", e)
+            return
+        job.complete_stage("sentiment", sentiment)
+        self._llm.submit(self._generate, job, transcription, sentiment)
+
+    def _generate(self, job, transcription, sentiment):
+        try:
+            if sentiment == "NEGATIVE":
+                ai_response = analyze_with_gpt4(transcription)
+            else:
+                ai_response = analyze_with_mistral(transcription)
+        except Exception as e:
+            job.fail("ai_response", e)
+            return
+        job.complete_stage("ai_response", ai_response)
+
+    def stats(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        counts = {}
+        for job in jobs:
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {
+            "jobs": len(jobs),
+            "by_status": counts,
+            "stt_queue": self._stt._work_queue.qsize(),
+            "llm_queue": self._llm._work_queue.qsize()
+        }
+
+
+analysis_pipeline = AnalysisPipeline()
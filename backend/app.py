@@ -1,43 +1,48 @@
-from flask import Flask, redirect, request, session, url_for, jsonify
+from flask import Flask, redirect, request, session, url_for, jsonify, Response, stream_with_context
 import os
 import tempfile
-import whisper
-import torch
-from transformers import pipeline
 from dotenv import load_dotenv
 import requests
 import json
 
 from firebase_admin import firestore
+from firebase_admin import auth as firebase_auth
 from googleapiclient.discovery import build
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
 from flask_cors import CORS
 
-from calendar_test import format_events_for_prompt
+from calendar_test import format_events_for_prompt, calendar_insights
 from wellness_score import generate_wellness_from_data
-from analysis import analyze_sentiment_with_distilbert, analyze_with_gpt4, analyze_with_mistral
+from wellness_scheduler import wellness_scheduler
+from chat_history import ChatHistoryStore
+from analysis_jobs import analysis_pipeline
+from stt_models import warm_up_whisper, WHISPER_WARMUP
+import llm_client
 
 from calendar_clients.google_calendar import *
 from calendar_clients.microsoft_calendar import *
+from calendar_clients.credential_manager import bind_session_user
+from calendar_clients.calendar_sync import start_of_today
 from chatbot import *
 
 load_dotenv(dotenv_path=r"NeuroBridge\backend\credentials\.env")
 
 app = Flask(__name__)
 CORS(app, origins=['http://localhost:5173'])
-app.secret_key = os.environ.get("FLASK_SECRET_KEY", "dev-default-secret")
+# The signed session selects whose stored calendar tokens are used, so there is no fallback key
+app.secret_key = os.environ.get("FLASK_SECRET_KEY")
+if not app.secret_key:
+    raise RuntimeError("FLASK_SECRET_KEY is not set")
 app.config.update(
     SESSION_COOKIE_SAMESITE="Lax",  # Helps cookies be accepted during OAuth redirects
     SESSION_COOKIE_SECURE=False     # Only set True if you're using HTTPS
 )
 
-device = 0 if torch.cuda.is_available() else -1
-sentiment_pipeline = pipeline(
-    "sentiment-analysis",
-    model="distilbert/distilbert-base-uncased-finetuned-sst-2-english",
-    device=device
-)
+if WHISPER_WARMUP:
+    warm_up_whisper()
+
+wellness_scheduler.start()
 
 SCOPES = ["https://www.googleapis.com/auth/calendar.readonly"]
 CLIENT_SECRETS_FILE = r"NeuroBridge\backend\credentials\client_secret.json"
@@ -49,31 +54,73 @@ def analyze():
         return jsonify({"error": "Missing audio file"}), 400
 
     audio_file = request.files['audio']
-    print("Loading Whisper model...")
-    stt_model = whisper.load_model("base")
-    print("Model loaded.")
 
+    # Only the upload is saved here; transcription, sentiment and the LLM reply
+    # run on the analysis pipeline and are removed from the temp dir when done
     tmp = tempfile.NamedTemporaryFile(suffix=".mp3", delete=False)
+    tmp.close()
     try:
         audio_file.save(tmp.name)
-        transcription_result = stt_model.transcribe(tmp.name)
-        transcription = transcription_result["text"]
-    finally:
-        tmp.close()
+    except Exception:
         os.remove(tmp.name)  # Clean up the temp file
-
-    sentiment = analyze_sentiment_with_distilbert(transcription)
-
-    if sentiment == "NEGATIVE":
-        ai_response = analyze_with_gpt4(transcription)
-    else:
-        ai_response = analyze_with_mistral(transcription)
+        raise
+    job = analysis_pipeline.submit(tmp.name)
+
+    if request.args.get("wait", "").lower() in ("1", "true", "yes"):
+        # Blocking mode for clients that expect the full result in one response
+        job.wait()
+        if job.status == "failed":
+            return jsonify({"error": job.error["message"], "job_id": job.id}), 500
+        return jsonify({
+            "transcription": job.results["transcription"],
+            "sentiment": job.results["sentiment"],
+            "ai_response": job.results["ai_response"]
+        })
 
     return jsonify({
-        "transcription": transcription,
-        "sentiment": sentiment,
-        "ai_response": ai_response
-    })
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": url_for("analyze_job", job_id=job.id),
+        "events_url": url_for("analyze_job_events", job_id=job.id)
+    }), 202
+
+@app.route('/analyze/jobs/<job_id>', methods=['GET'])
+def analyze_job(job_id):
+    job = analysis_pipeline.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/analyze/jobs/<job_id>/events', methods=['GET'])
+def analyze_job_events(job_id):
+    # Server-sent events, one per completed stage, ending with done or error
+    job = analysis_pipeline.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+
+    def generate():
+        sent = 0
+        while True:
+            events = job.wait_events(sent, timeout=15)
+            for stage, payload in events:
+                yield sse_event(stage, payload)
+            sent += len(events)
+            if job.finished and sent == len(job.events):
+                if job.status == "done":
+                    yield sse_event("done", job.to_dict())
+                return
+            if not events:
+                yield ": keep-alive\n\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route('/api/analyze-metrics', methods=['GET'])
+def analyze_metrics():
+    return jsonify(analysis_pipeline.stats())
 
 # Optional: Revoke token if you want to invalidate it completely
 def revoke_token(token):
@@ -83,8 +130,27 @@ def revoke_token(token):
         headers={"content-type": "application/x-www-form-urlencoded"},
     )
 
+def verified_user_id():
+    # uid from a verified Firebase ID token (header, or query string on browser redirects)
+    header = request.headers.get("Authorization", "")
+    id_token = header[len("Bearer "):] if header.startswith("Bearer ") else request.args.get("id_token")
+    if not id_token:
+        return None
+    try:
+        return firebase_auth.verify_id_token(id_token)["uid"]
+    except Exception as e:
+        print(f"Rejected Firebase ID token: {e}")
+        return None
+
+def remember_calendar_user():
+    # Calendar tokens and events are stored per user, so the id must be verified
+    user_id = verified_user_id()
+    if user_id:
+        bind_session_user(user_id)
+
 @app.route("/calendar")
 def google_calendar():
+    remember_calendar_user()
     events = get_google_calendar_events()
     if events is None:
         return redirect(url_for("authorize"))
@@ -124,6 +190,7 @@ def microsoft_callback():
 
 @app.route("/microsoft_calendar")
 def microsoft_calendar():
+    remember_calendar_user()
     events = get_microsoft_calendar_events()
     if events is None:
         return redirect(url_for("login_microsoft"))
@@ -131,66 +198,29 @@ def microsoft_calendar():
         return "No upcoming Microsoft calendar events found."
     return "<br>".join([event.get("subject", "[No Subject]") for event in events])
 
+@app.route("/api/calendar-insights", methods=["GET", "POST"])
+def calendar_insight():
+    # Metrics come back immediately; poll the schedule hash for the narrative
+    data = request.get_json(silent=True) or {}
+    events = data.get("events")
+    if events is None:
+        remember_calendar_user()
+        # Include meetings that already ended today so the day's metrics and hash stay stable
+        today = start_of_today()
+        events = ((get_google_calendar_events(limit=None, since=today) or [])
+                  + (get_microsoft_calendar_events(limit=None, since=today) or []))
+    return jsonify(calendar_insights.get(events))
 
-db = firestore.client()
-
-MAX_HISTORY_MESSAGES = 10  # Limit context length
-
-def get_conversation_history(user_id):
-    doc_ref = db.collection("conversations").document(user_id)
-    doc = doc_ref.get()
-    if doc.exists:
-        history = doc.to_dict().get("messages", [])
-        # Limit to last N messages
-        return history[-MAX_HISTORY_MESSAGES:]
-    else:
-        return []
-
-def get_user_context(user_id):
-    journals = [doc.to_dict() for doc in db.collection("journals").where("user_id", "==", user_id).stream()]
-    calendars = [doc.to_dict() for doc in db.collection("calendar").where("user_id", "==", user_id).stream()]
-    return {
-        "journals": journals,
-        "calendar": calendars
-    }
-
-def chat_with_mistral(messages, context_data=None):
-    system_prompt = (
-        "You are a compassionate cognitive wellness assistant. "
-        "Help the user reflect, manage stress, and suggest improvements to wellbeing. "
-        "Be thoughtful and kind."
-    )
+@app.route("/api/calendar-insights/<schedule_hash>", methods=["GET"])
+def calendar_insight_narrative(schedule_hash):
+    result = calendar_insights.lookup(schedule_hash)
+    if result is None:
+        return jsonify({"error": "Unknown schedule"}), 404
+    return jsonify(result)
 
-    # Prepare conversation in Mistral prompt format:
-    # We build a dialogue string including system prompt + previous messages
-    conversation_text = system_prompt + "\n\n"
-    if context_data:
-        context_str = json.dumps(context_data, indent=2)
-        conversation_text += f"Context:\n{context_str}\n\n"
-
-    for msg in messages:
-        role = msg["role"]
-        content = msg["content"]
-        if role == "user":
-            conversation_text += f"User: {content}\n"
-        else:  # assistant
-            conversation_text += f"Assistant: {content}\n"
-
-    conversation_text += "Assistant:"
-
-    response = requests.post(
-        "http://localhost:11434/api/generate",
-        json={
-            "model": "mistral",
-            "prompt": conversation_text,
-            "stream": False,
-            "options": {
-                    "num_predict": 40  # lower = shorter
-            }
-        }
-    )
 
-    return response.json().get("response", "").strip()
+db = firestore.client()
+chat_history_store = ChatHistoryStore(db)
 
 @app.route("/chatbot", methods=["POST"])
 def chatbot():
@@ -201,30 +231,70 @@ def chatbot():
     if not user_id or not user_message:
         return jsonify({"error": "Missing user_id or message"}), 400
 
-    # Load existing messages from Firestore
-    user_ref = db.collection("chats").document(user_id)
-    doc = user_ref.get()
-    if doc.exists:
-        chat_history = doc.to_dict().get("messages", [])
-    else:
-        chat_history = []
+    # Chat activity makes this user a candidate for background wellness refreshes
+    wellness_scheduler.touch(user_id)
 
-    # Append user message
-    chat_history.append({"role": "user", "content": user_message})
+    # Load the recent window and summary of older turns from Firestore
+    history = chat_history_store.load(user_id)
+    user_entry = {"role": "user", "content": user_message}
 
-    # Generate chatbot reply (replace with your actual model call)
-    bot_reply = chat_with_mistral(chat_history)  # your function to generate reply
+    bot_reply = chat_with_mistral(history["messages"] + [user_entry], summary=history["summary"], session_id=user_id)
 
-    # Append bot reply
-    chat_history.append({"role": "assistant", "content": bot_reply})
-
-    # Save updated chat history back to Firestore
-    user_ref.set({"messages": chat_history})
+    # Append just the new exchange to Firestore
+    chat_history_store.append(user_id, user_entry, {"role": "assistant", "content": bot_reply})
 
     return jsonify({"response": bot_reply})
 
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route("/chatbot/stream", methods=["POST"])
+def chatbot_stream():
+    # Same as /chatbot, but relays reply tokens as server-sent events
+    data = request.json
+    user_id = data.get("user_id")
+    user_message = data.get("message")
+
+    if not user_id or not user_message:
+        return jsonify({"error": "Missing user_id or message"}), 400
+
+    # Chat activity makes this user a candidate for background wellness refreshes
+    wellness_scheduler.touch(user_id)
+
+    history = chat_history_store.load(user_id)
+    user_entry = {"role": "user", "content": user_message}
+
+    def generate():
+        reply_parts = []
+        try:
+            for token in stream_chat_with_mistral(
+                history["messages"] + [user_entry], summary=history["summary"], session_id=user_id
+            ):
+                reply_parts.append(token)
+                yield sse_event("token", {"token": token})
+        except Exception as e:
+            print(f"Error streaming chat reply: {e}")
+            yield sse_event("error", {"error": str(e)})
+            return
+
+        # Persist only once the full reply is known
+        bot_reply = "".join(reply_parts).strip()
+        chat_history_store.append(user_id, user_entry, {"role": "assistant", "content": bot_reply})
+
+        yield sse_event("done", {"response": bot_reply})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.route('/api/wellness-score', methods=['GET'])
 def wellness_score():
+    user_id = request.args.get("user_id")
+    if user_id:
+        return user_wellness_score(user_id)
+
     result = generate_wellness_from_data()
     score = result["score"]
     suggestion = result["suggestion"]
@@ -234,6 +304,31 @@ def wellness_score():
         "suggestion": suggestion
     })
 
+@app.route('/api/wellness-score/<user_id>', methods=['GET'])
+def user_wellness_score(user_id):
+    # Scores are built from the user's journals, so only that user may read them
+    if verified_user_id() != user_id:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    # Served from the scheduler's cache; stale scores are refreshed in the background
+    result = wellness_scheduler.get(user_id)
+
+    return jsonify({
+        "score": result["score"],
+        "suggestion": result["suggestion"],
+        "suggestion_status": "pending" if result["suggestion"] is None else "ready"
+    })
+
+@app.route('/api/wellness-scheduler', methods=['GET'])
+def wellness_scheduler_stats():
+    return jsonify(wellness_scheduler.stats())
+
+@app.route('/api/llm-metrics', methods=['GET'])
+def llm_metrics():
+    metrics = llm_client.get_metrics()
+    metrics["chat_sessions"] = chat_sessions.stats()
+    return jsonify(metrics)
+
 
 if __name__ == '__main__':
     os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
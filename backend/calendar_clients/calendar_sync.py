@@ -0,0 +1,200 @@
+import os
+import re
+import time
+import hashlib
+import threading
+from datetime import datetime, timedelta, timezone
+
+import requests
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+
+CALENDAR_CACHE_TTL = int(os.environ.get("CALENDAR_CACHE_TTL", "300"))  # seconds
+CALENDAR_WINDOW_DAYS = int(os.environ.get("CALENDAR_WINDOW_DAYS", "30"))
+GRAPH_DELTA_URL = "https://graph.microsoft.com/v1.0/me/calendarView/delta"
+
+
+def credential_key(*parts):
+    # Stable cache key that never keeps raw tokens around as dict keys
+    raw = "\0".join(part or "" for part in parts)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def event_time(event, field):
+    value = event.get(field) or {}
+    value = value.get("dateTime") or value.get("date")
+    if not value:
+        return datetime.min.replace(tzinfo=timezone.utc)
+    # Graph sends 7 fractional digits and no offset (UTC, per the Prefer header)
+    parsed = datetime.fromisoformat(re.sub(r"(\.\d{6})\d+", r"\1", value.replace("Z", "+00:00")))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def start_of_today():
+    """Local midnight today, as an aware datetime."""
+    return datetime.now().astimezone().replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def sync_window():
+    """(window id, start, end): today (local) through CALENDAR_WINDOW_DAYS ahead."""
+    start = start_of_today()
+    return start.date().isoformat(), start, start + timedelta(days=CALENDAR_WINDOW_DAYS)
+
+
+class CalendarCacheEntry:
+    def __init__(self):
+        self.events = {}
+        self.sync_state = None
+        self.synced_at = 0.0
+        self.lock = threading.Lock()
+
+
+class CalendarSync:
+    """Local per-user event cache kept current with incremental syncs.
+
+    Reads within CALENDAR_CACHE_TTL of the last sync are served from memory;
+    after that only the changes since the previous sync are fetched.
+    Subclasses implement _sync(key, entry, credential) -> list of changed events.
+    """
+
+    def __init__(self, ttl=CALENDAR_CACHE_TTL):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, key):
+        with self._lock:
+            return self._entries.setdefault(key, CalendarCacheEntry())
+
+    def events(self, key, credential, limit=5, on_change=None, since=None):
+        """Events for key ending after since (default now), soonest first.
+
+        on_change gets the changed events after a sync.
+        """
+        entry = self._entry(key)
+        with entry.lock:
+            if time.monotonic() - entry.synced_at >= self.ttl:
+                changed = self._sync(key, entry, credential)
+                entry.synced_at = time.monotonic()
+                if changed and on_change:
+                    on_change(changed)
+            # Drop events that ended before today; today's stay for the day's metrics
+            cutoff = start_of_today()
+            for event_id in [event_id for event_id, event in entry.events.items() if event_time(event, "end") < cutoff]:
+                del entry.events[event_id]
+            since = since or datetime.now(timezone.utc)
+            upcoming = [event for event in entry.events.values() if event_time(event, "end") >= since]
+
+        upcoming.sort(key=lambda event: event_time(event, "start"))
+        return upcoming[:limit] if limit else upcoming
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class GoogleCalendarSync(CalendarSync):
+    """Google Calendar via events.list sync tokens, one built service per credential."""
+
+    def __init__(self, ttl=CALENDAR_CACHE_TTL):
+        super().__init__(ttl)
+        self._services = {}
+        self._services_lock = threading.Lock()
+
+    def service(self, key, creds):
+        with self._services_lock:
+            cached = self._services.get(key)
+            # Rebuilt only when the user re-authorizes; refreshes update creds in place
+            if cached is None or cached[0] is not creds:
+                cached = (creds, build("calendar", "v3", credentials=creds, cache_discovery=False))
+                self._services[key] = cached
+            return cached[1]
+
+    def _sync(self, key, entry, creds):
+        service = self.service(key, creds)
+        window_id, start, end = sync_window()
+        params = {"calendarId": "primary", "singleEvents": True}
+        # Sync tokens are tied to the window of the full sync they came from, so
+        # restart daily like the Graph delta links; recurring events are only
+        # expanded CALENDAR_WINDOW_DAYS ahead
+        if entry.sync_state and entry.sync_state["window_start"] == window_id:
+            params["syncToken"] = entry.sync_state["sync_token"]
+        else:
+            entry.sync_state = None
+            entry.events.clear()
+            params["timeMin"] = start.isoformat()
+            params["timeMax"] = end.isoformat()
+
+        changed = []
+        page_token = None
+        try:
+            while True:
+                result = service.events().list(pageToken=page_token, **params).execute()
+                for event in result.get("items", []):
+                    if event.get("status") == "cancelled":
+                        entry.events.pop(event["id"], None)
+                    elif event_time(event, "start") >= end:
+                        # Incremental results aren't windowed; ignore events beyond it
+                        entry.events.pop(event["id"], None)
+                        continue
+                    else:
+                        entry.events[event["id"]] = event
+                    changed.append(event)
+                page_token = result.get("nextPageToken")
+                if not page_token:
+                    entry.sync_state = {"window_start": window_id, "sync_token": result.get("nextSyncToken")}
+                    return changed
+        except HttpError as e:
+            if e.resp.status == 410:
+                # Sync token expired: start over with a full sync
+                entry.sync_state = None
+                entry.events.clear()
+                return self._sync(key, entry, creds)
+            raise
+
+
+class MicrosoftCalendarSync(CalendarSync):
+    """Microsoft Graph calendar via calendarView delta queries."""
+
+    def __init__(self, ttl=CALENDAR_CACHE_TTL):
+        super().__init__(ttl)
+        self._http = requests.Session()
+
+    def _sync(self, key, entry, access_token):
+        headers = {
+            "Authorization": f"Bearer {access_token}",
+            "Prefer": 'outlook.timezone="UTC", odata.maxpagesize=50'
+        }
+        window_id, start, end = sync_window()
+        # Delta links are tied to the window they were created for, so restart daily
+        if not entry.sync_state or entry.sync_state["window_start"] != window_id:
+            entry.events.clear()
+            url = GRAPH_DELTA_URL
+            params = {"startDateTime": start.isoformat(), "endDateTime": end.isoformat()}
+        else:
+            url = entry.sync_state["delta_link"]
+            params = None
+
+        changed = []
+        while url:
+            response = self._http.get(url, headers=headers, params=params, timeout=(5, 30))
+            if response.status_code == 410:
+                entry.sync_state = None
+                return self._sync(key, entry, access_token)
+            response.raise_for_status()
+            body = response.json()
+            for event in body.get("value", []):
+                if "@removed" in event:
+                    entry.events.pop(event["id"], None)
+                else:
+                    entry.events[event["id"]] = event
+                changed.append(event)
+            params = None
+            url = body.get("@odata.nextLink")
+            if "@odata.deltaLink" in body:
+                entry.sync_state = {"window_start": window_id, "delta_link": body["@odata.deltaLink"]}
+        return changed
+
+
+google_calendar_sync = GoogleCalendarSync()
+microsoft_calendar_sync = MicrosoftCalendarSync()
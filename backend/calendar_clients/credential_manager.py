@@ -0,0 +1,235 @@
+import os
+import json
+import hashlib
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+import msal
+import requests
+from flask import session
+from cryptography.fernet import Fernet
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_oauthlib.flow import Flow
+
+CREDENTIAL_STORE_DIR = os.environ.get("CREDENTIAL_STORE_DIR", os.path.join("credentials", "tokens"))
+CREDENTIAL_STORE_KEY = os.environ.get("CREDENTIAL_STORE_KEY")  # Fernet key; generated into the store dir if unset
+TOKEN_REFRESH_MARGIN = int(os.environ.get("TOKEN_REFRESH_MARGIN", "300"))  # seconds before expiry
+
+
+def session_user_id():
+    # Tokens are stored server-side per user; the signed cookie session only carries
+    # the id, which is set here or by bind_session_user and never from request data
+    if not session.get("calendar_user_id"):
+        session["calendar_user_id"] = uuid.uuid4().hex
+    return session["calendar_user_id"]
+
+def bind_session_user(user_id):
+    """Key this session's calendar tokens by an already verified user id."""
+    session["calendar_user_id"] = user_id
+
+
+class EncryptedTokenStore:
+    """Per-user, per-provider token blobs, Fernet-encrypted on local disk."""
+
+    def __init__(self, directory=CREDENTIAL_STORE_DIR, key=CREDENTIAL_STORE_KEY):
+        self.directory = directory
+        self._key = key
+        self._fernet = None
+        self._lock = threading.Lock()
+
+    def _cipher(self):
+        if self._fernet is None:
+            os.makedirs(self.directory, exist_ok=True)
+            key = self._key
+            if not key:
+                key_path = os.path.join(self.directory, ".key")
+                if not os.path.exists(key_path):
+                    fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                    with os.fdopen(fd, "wb") as f:
+                        f.write(Fernet.generate_key())
+                with open(key_path, "rb") as f:
+                    key = f.read().strip()
+            self._fernet = Fernet(key)
+        return self._fernet
+
+    def _path(self, user_id, provider):
+        name = hashlib.sha256(f"{provider}\0{user_id}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{name}.token")
+
+    def get(self, user_id, provider):
+        with self._lock:
+            path = self._path(user_id, provider)
+            if not os.path.exists(path):
+                return None
+            with open(path, "rb") as f:
+                return json.loads(self._cipher().decrypt(f.read()))
+
+    def put(self, user_id, provider, data):
+        with self._lock:
+            token = self._cipher().encrypt(json.dumps(data).encode("utf-8"))
+            path = self._path(user_id, provider)
+            tmp_path = f"{path}.tmp"
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(token)
+            os.replace(tmp_path, path)
+
+    def delete(self, user_id, provider):
+        with self._lock:
+            try:
+                os.remove(self._path(user_id, provider))
+            except FileNotFoundError:
+                pass
+
+
+class GoogleCredentialManager:
+    """Client secrets parsed once; per-user credentials kept in memory and in the
+    encrypted store, refreshed shortly before they expire."""
+
+    def __init__(self, client_secrets_file, scopes, store):
+        self.client_secrets_file = client_secrets_file
+        self.scopes = scopes
+        self.store = store
+        self._client_config = None
+        self._credentials = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._request = Request()
+
+    @property
+    def client_config(self):
+        if self._client_config is None:
+            with open(self.client_secrets_file) as f:
+                self._client_config = json.load(f)
+        return self._client_config
+
+    def flow(self, redirect_uri, state=None, code_verifier=None):
+        flow = Flow.from_client_config(self.client_config, scopes=self.scopes, state=state, code_verifier=code_verifier)
+        flow.redirect_uri = redirect_uri
+        return flow
+
+    def _user_lock(self, user_id):
+        with self._lock:
+            return self._locks.setdefault(user_id, threading.Lock())
+
+    def save(self, user_id, credentials):
+        self.store.put(user_id, "google", {
+            "token": credentials.token,
+            "refresh_token": credentials.refresh_token,
+            "token_uri": credentials.token_uri,
+            "client_id": credentials.client_id,
+            "client_secret": credentials.client_secret,
+            "scopes": credentials.scopes,
+            "expiry": credentials.expiry.isoformat() if credentials.expiry else None
+        })
+        with self._lock:
+            self._credentials[user_id] = credentials
+
+    def credentials(self, user_id):
+        """Valid credentials for user_id, or None if the user has to authorize."""
+        with self._user_lock(user_id):
+            with self._lock:
+                creds = self._credentials.get(user_id)
+            if creds is None:
+                data = self.store.get(user_id, "google")
+                if not data:
+                    return None
+                expiry = data.pop("expiry", None)
+                creds = Credentials(**data)
+                # google-auth compares expiry as naive UTC
+                creds.expiry = datetime.fromisoformat(expiry) if expiry else None
+                with self._lock:
+                    self._credentials[user_id] = creds
+
+            expires_soon = creds.expiry and creds.expiry - datetime.utcnow() < timedelta(seconds=TOKEN_REFRESH_MARGIN)
+            if (expires_soon or not creds.token) and creds.refresh_token:
+                try:
+                    creds.refresh(self._request)
+                except Exception as e:
+                    print(f"Google token refresh failed for {user_id}: {e}")
+                    if not creds.valid:
+                        return None
+                else:
+                    self.save(user_id, creds)
+            return creds
+
+    def forget(self, user_id):
+        with self._lock:
+            self._credentials.pop(user_id, None)
+        self.store.delete(user_id, "google")
+
+
+class MicrosoftCredentialManager:
+    """One MSAL app and serialized token cache per user; acquire_token_silent
+    refreshes tokens before they expire."""
+
+    def __init__(self, client_id, client_secret, authority, scopes, store):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.authority = authority
+        self.scopes = scopes
+        self.store = store
+        self._apps = {}
+        self._lock = threading.Lock()
+        self._auth_app = None
+        self._http = requests.Session()  # connection pool shared by every user's MSAL app
+
+    def _new_app(self, token_cache=None):
+        return msal.ConfidentialClientApplication(
+            client_id=self.client_id,
+            client_credential=self.client_secret,
+            authority=self.authority,
+            token_cache=token_cache,
+            http_client=self._http
+        )
+
+    def auth_url(self, redirect_uri):
+        with self._lock:
+            if self._auth_app is None:
+                self._auth_app = self._new_app()
+        return self._auth_app.get_authorization_request_url(scopes=self.scopes, redirect_uri=redirect_uri)
+
+    def _user_app(self, user_id):
+        with self._lock:
+            entry = self._apps.get(user_id)
+            if entry is None:
+                cache = msal.SerializableTokenCache()
+                data = self.store.get(user_id, "microsoft")
+                if data:
+                    cache.deserialize(data["cache"])
+                entry = (self._new_app(cache), cache, threading.Lock())
+                self._apps[user_id] = entry
+            return entry
+
+    def _persist(self, user_id, cache):
+        if cache.has_state_changed:
+            self.store.put(user_id, "microsoft", {"cache": cache.serialize()})
+            cache.has_state_changed = False
+
+    def exchange(self, user_id, code, redirect_uri):
+        app, cache, lock = self._user_app(user_id)
+        with lock:
+            result = app.acquire_token_by_authorization_code(code, scopes=self.scopes, redirect_uri=redirect_uri)
+            self._persist(user_id, cache)
+        return result
+
+    def access_token(self, user_id):
+        """Cached access token, refreshed by MSAL ahead of expiry; None if the user has to sign in."""
+        app, cache, lock = self._user_app(user_id)
+        with lock:
+            accounts = app.get_accounts()
+            if not accounts:
+                return None
+            result = app.acquire_token_silent(self.scopes, account=accounts[0])
+            self._persist(user_id, cache)
+        return (result or {}).get("access_token")
+
+    def forget(self, user_id):
+        with self._lock:
+            self._apps.pop(user_id, None)
+        self.store.delete(user_id, "microsoft")
+
+
+token_store = EncryptedTokenStore()
@@ -2,20 +2,18 @@ import os
 import msal
 import requests
 from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import Flow
 from flask import url_for, session
-from googleapiclient.discovery import build
-from db_storage import *
+from db_storage import save_calendar_events
+from calendar_clients.calendar_sync import google_calendar_sync, credential_key
+from calendar_clients.credential_manager import GoogleCredentialManager, token_store, session_user_id
 
 GOOGLE_CLIENT_SECRETS_FILE = r"NeuroBridge\backend\credentials\client_secret.json"
 GOOGLE_SCOPES = ["https://www.googleapis.com/auth/calendar.readonly"]
 
+google_credentials = GoogleCredentialManager(GOOGLE_CLIENT_SECRETS_FILE, GOOGLE_SCOPES, token_store)
+
 def get_google_auth_url():
-    flow = Flow.from_client_secrets_file(
-        GOOGLE_CLIENT_SECRETS_FILE,
-        scopes=GOOGLE_SCOPES
-    )
-    flow.redirect_uri = url_for("google_oauth2callback", _external=True)
+    flow = google_credentials.flow(url_for("google_oauth2callback", _external=True))
 
     auth_url, state = flow.authorization_url(
         access_type="offline",
@@ -23,46 +21,43 @@ def get_google_auth_url():
         include_granted_scopes="true"
     )
     session["google_oauth_state"] = state
+    session["google_code_verifier"] = flow.code_verifier
     return auth_url
 
 def get_google_token(auth_response_url):
-    state = session.get("google_oauth_state")
-    flow = Flow.from_client_secrets_file(
-        GOOGLE_CLIENT_SECRETS_FILE,
-        scopes=GOOGLE_SCOPES,
-        state=state
+    flow = google_credentials.flow(
+        url_for("google_oauth2callback", _external=True),
+        state=session.get("google_oauth_state"),
+        code_verifier=session.pop("google_code_verifier", None)
     )
-    flow.redirect_uri = url_for("google_oauth2callback", _external=True)
     flow.fetch_token(authorization_response=auth_response_url)
     credentials = flow.credentials
 
-    # Store credentials in session (or DB)
-    session["google_credentials"] = {
-        "token": credentials.token,
-        "refresh_token": credentials.refresh_token,
-        "token_uri": credentials.token_uri,
-        "client_id": credentials.client_id,
-        "client_secret": credentials.client_secret,
-        "scopes": credentials.scopes
-    }
+    # Tokens are kept server-side, encrypted; the session only holds the user id
+    google_credentials.save(session_user_id(), credentials)
     return credentials
 
-def get_google_calendar_events():
-    if "google_credentials" not in session:
+def _session_credentials(user_id):
+    # Sessions created before tokens moved server-side still carry them in the cookie
+    creds_data = session.pop("google_credentials", None)
+    if creds_data:
+        google_credentials.save(user_id, Credentials(**creds_data))
+    return google_credentials.credentials(user_id)
+
+def get_google_calendar_events(limit=5, since=None):
+    user_id = session_user_id()
+    creds = _session_credentials(user_id)
+    if creds is None:
         return None
-    creds_data = session["google_credentials"]
-    creds = Credentials(**creds_data)
 
-    service = build("calendar", "v3", credentials=creds)
-    events_result = service.events().list(
-        calendarId="primary", maxResults=5, singleEvents=True, orderBy="startTime"
-    ).execute()
-    
-    events = events_result.get("items", [])
-    
-    if events:
-        save_events_to_json(events)
-        upload_events_to_firestore(events)
-    
-    return events
+    # Served from the local cache; only changes since the last sync are fetched
+    key = credential_key("google", user_id)
+    return google_calendar_sync.events(
+        key, creds, limit=limit, since=since,
+        on_change=lambda events: _store_changed_events(user_id, events)
+    )
 
+def _store_changed_events(user_id, events):
+    removed_ids = [event["id"] for event in events if event.get("status") == "cancelled"]
+    events = [event for event in events if event.get("status") != "cancelled"]
+    save_calendar_events(user_id, "google", events, removed_ids)
@@ -4,7 +4,9 @@ import requests
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
 from flask import url_for, session
-from db_storage import save_events_to_json,upload_events_to_firestore
+from db_storage import save_calendar_events
+from calendar_clients.calendar_sync import microsoft_calendar_sync, credential_key
+from calendar_clients.credential_manager import MicrosoftCredentialManager, token_store, session_user_id
 
 MS_CLIENT_ID = os.getenv("MS_CLIENT_ID", "cee2560c-51ff-48a0-82ea-b1b92fc80396")
 MS_CLIENT_SECRET = os.getenv("MS_CLIENT_SECRET", "your_ms_client_secret_here")
@@ -13,55 +15,32 @@ MS_AUTHORITY = f"https://login.microsoftonline.com/{MS_TENANT_ID}"
 MS_SCOPES = ["Calendars.Read", "Mail.Read", "Chat.Read"]
 MS_REDIRECT_URI = "http://localhost:5000/microsoft_callback"
 
-msal_app = msal.ConfidentialClientApplication(
-    client_id=MS_CLIENT_ID,
-    client_credential=MS_CLIENT_SECRET,
-    authority=MS_AUTHORITY
-)
+microsoft_credentials = MicrosoftCredentialManager(MS_CLIENT_ID, MS_CLIENT_SECRET, MS_AUTHORITY, MS_SCOPES, token_store)
 
 def get_microsoft_auth_url():
-    auth_url = msal_app.get_authorization_request_url(
-        scopes=MS_SCOPES,
-        redirect_uri=MS_REDIRECT_URI
-    )
-    return auth_url
+    return microsoft_credentials.auth_url(MS_REDIRECT_URI)
 
 def get_microsoft_token(code):
-    result = msal_app.acquire_token_by_authorization_code(
-        code,
-        scopes=MS_SCOPES,
-        redirect_uri=MS_REDIRECT_URI
-    )
-    if "access_token" in result:
-        session["ms_access_token"] = result["access_token"]
-    return result
+    # MSAL's per-user token cache is persisted encrypted server-side
+    return microsoft_credentials.exchange(session_user_id(), code, MS_REDIRECT_URI)
 
-def get_microsoft_calendar_events():
-    token_data = session.get("microsoft_token")
-    if not token_data:
-        return None
-
-    access_token = token_data.get("access_token")
+def get_microsoft_calendar_events(limit=5, since=None):
+    user_id = session_user_id()
+    access_token = microsoft_credentials.access_token(user_id)
     if not access_token:
         return None
 
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Prefer": 'outlook.timezone="UTC"'
-    }
-
-    response = requests.get(
-        "https://graph.microsoft.com/v1.0/me/events?$orderby=start/dateTime&$top=5",
-        headers=headers
-    )
-
-    if response.status_code != 200:
+    # Served from the local cache; only changes since the last delta sync are fetched
+    key = credential_key("microsoft", user_id)
+    try:
+        return microsoft_calendar_sync.events(
+            key, access_token, limit=limit, since=since,
+            on_change=lambda events: _store_changed_events(user_id, events)
+        )
+    except requests.RequestException:
         return None
 
-    events = response.json().get("value", [])
-
-    if events:
-        save_events_to_json(events)
-        upload_events_to_firestore(events)
-
-    return events
+def _store_changed_events(user_id, events):
+    removed_ids = [event["id"] for event in events if "@removed" in event]
+    events = [event for event in events if "@removed" not in event]
+    save_calendar_events(user_id, "microsoft", events, removed_ids)
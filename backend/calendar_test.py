@@ -1,36 +1,212 @@
-import requests
+import os
 import json
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 
-def format_events_for_prompt(events):
-    if not events:
-        return "There are no events scheduled today."
+import numpy as np
+
+import llm_client
+from calendar_clients.calendar_sync import event_time
+
+WORKDAY_START_HOUR = int(os.environ.get("CALENDAR_WORKDAY_START", "8"))
+WORKDAY_END_HOUR = int(os.environ.get("CALENDAR_WORKDAY_END", "20"))
+BACK_TO_BACK_MINUTES = int(os.environ.get("CALENDAR_BACK_TO_BACK_MINUTES", "5"))
+MIN_FREE_BLOCK_MINUTES = int(os.environ.get("CALENDAR_MIN_FREE_BLOCK_MINUTES", "30"))
+CALENDAR_INSIGHT_CACHE_SIZE = int(os.environ.get("CALENDAR_INSIGHT_CACHE_SIZE", "256"))
+
+LOAD_LEVELS = [(2, "light"), (5, "moderate"), (8, "busy")]  # busy hours below each threshold
+
+
+def _on_day(event, day):
+    start, end = event.get("start") or {}, event.get("end") or {}
+    if "dateTime" not in start:
+        # All-day events: end date is exclusive
+        first = datetime.fromisoformat(start.get("date", "1970-01-01")[:10]).date()
+        last = datetime.fromisoformat(end.get("date", start.get("date", "1970-01-01"))[:10]).date()
+        return first <= day < max(last, first + timedelta(days=1))
+    day_start = datetime.combine(day, datetime.min.time()).astimezone()
+    return event_time(event, "end") > day_start and event_time(event, "start") < day_start + timedelta(days=1)
+
+def events_on_day(events, day=None):
+    """The events (timed or all-day) that fall on day; only these feed the metrics, prompt and hash."""
+    day = day or datetime.now().date()
+    return [event for event in events or [] if _on_day(event, day)]
+
+def _timed_events(events, day):
+    """(summary, start, end) in local minutes since midnight for timed events overlapping day."""
+    day_start = datetime.combine(day, datetime.min.time()).astimezone()
+    timed = []
+    for event in events:
+        if "dateTime" not in (event.get("start") or {}):
+            continue  # all-day events don't occupy working hours
+        start = (event_time(event, "start").astimezone() - day_start) / timedelta(minutes=1)
+        end = (event_time(event, "end").astimezone() - day_start) / timedelta(minutes=1)
+        if end > 0 and start < 24 * 60:
+            timed.append((event.get("summary") or event.get("subject") or "No Title", start, end))
+    return timed
+
+def _clock(minutes):
+    minutes = int(round(minutes))
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+def schedule_metrics(events, day=None):
+    """Deterministic load metrics for one day, computed over arrays of start/end minutes."""
+    day = day or datetime.now().date()
+    events = events_on_day(events, day)
+    timed = _timed_events(events, day)
+    all_day = sum(1 for event in events if "dateTime" not in (event.get("start") or {}))
+    metrics = {
+        "date": day.isoformat(),
+        "event_count": len(timed),
+        "all_day_events": all_day,
+        "busy_hours": 0.0,
+        "back_to_back": 0,
+        "overlaps": 0,
+        "free_blocks": [],
+        "longest_free_block_minutes": 0,
+        "load": "free"
+    }
+
+    work_start, work_end = WORKDAY_START_HOUR * 60, WORKDAY_END_HOUR * 60
+    if timed:
+        bounds = np.array([(start, end) for _, start, end in timed], dtype=float)
+        bounds = np.clip(bounds[np.argsort(bounds[:, 0])], 0, 24 * 60)
+        starts, ends = bounds[:, 0], bounds[:, 1]
+
+        # Latest end seen so far; a start before it means the events overlap
+        running_end = np.maximum.accumulate(ends)
+        gaps = starts[1:] - running_end[:-1]
+        metrics["back_to_back"] = int(np.count_nonzero((gaps >= 0) & (gaps <= BACK_TO_BACK_MINUTES)))
+        metrics["overlaps"] = int(np.count_nonzero(gaps < 0))
+
+        # Merge overlapping events into busy blocks
+        block_starts = np.concatenate(([0], np.flatnonzero(gaps > 0) + 1))
+        block_ends = np.append(block_starts[1:] - 1, len(starts) - 1)
+        busy_starts, busy_ends = starts[block_starts], running_end[block_ends]
+        metrics["busy_hours"] = round(float(np.sum(busy_ends - busy_starts)) / 60, 2)
+    else:
+        busy_starts = busy_ends = np.array([], dtype=float)
+
+    # Free time is the working window minus the busy blocks
+    free_starts = np.clip(np.concatenate(([work_start], busy_ends)), work_start, work_end)
+    free_ends = np.clip(np.concatenate((busy_starts, [work_end])), work_start, work_end)
+    lengths = free_ends - free_starts
+    keep = lengths >= MIN_FREE_BLOCK_MINUTES
+    metrics["free_blocks"] = [
+        {"start": _clock(start), "end": _clock(end), "minutes": int(length)}
+        for start, end, length in zip(free_starts[keep], free_ends[keep], lengths[keep])
+    ]
+    metrics["longest_free_block_minutes"] = int(lengths.max()) if len(lengths) else 0
+
+    if timed:
+        metrics["load"] = next(
+            (level for threshold, level in LOAD_LEVELS if metrics["busy_hours"] < threshold), "overloaded"
+        )
+    return metrics
 
+def schedule_hash(events, day=None):
+    day = day or datetime.now().date()
+    key = sorted(
+        (event.get("summary") or event.get("subject") or "", str(event.get("start")), str(event.get("end")))
+        for event in events_on_day(events, day)
+    )
+    return hashlib.sha256(json.dumps([day.isoformat(), key]).encode("utf-8")).hexdigest()
+
+def build_schedule_prompt(events, metrics):
     prompt = "Here is my schedule for today:\n"
     for event in events:
         start = event['start'].get('dateTime', event['start'].get('date'))
         end = event['end'].get('dateTime', event['end'].get('date'))
-        summary = event.get('summary', 'No Title')
+        summary = event.get('summary') or event.get('subject') or 'No Title'
         prompt += f"- {summary} from {start} to {end}\n"
 
+    free = ", ".join(f"{block['start']}-{block['end']}" for block in metrics["free_blocks"]) or "none"
+    prompt += (
+        f"\nBusy hours: {metrics['busy_hours']} ({metrics['load']}), "
+        f"back-to-back meetings: {metrics['back_to_back']}, overlaps: {metrics['overlaps']}, "
+        f"free blocks: {free}\n"
+    )
     prompt += "\nCan you tell me how busy my day is and suggest ways to reduce workload or manage time better?"
+    return prompt
 
-    return ask_mistral(prompt)
 
-def ask_mistral(prompt):
-    response = requests.post(
-        "http://localhost:11434/api/generate",
-        json={"model": "mistral", "prompt": prompt},
-        stream=True
-    )
+class CalendarInsights:
+    """Schedule metrics computed inline, with the LLM narrative generated in the
+    background and cached per schedule hash."""
+
+    def __init__(self, max_workers=1, cache_size=CALENDAR_INSIGHT_CACHE_SIZE):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="calendar-insights")
+        self._cache = OrderedDict()  # schedule hash -> {"status", "narrative", "future"}
+        self._lock = threading.Lock()
+        self.cache_size = cache_size
+
+    def _generate(self, key, events, metrics):
+        try:
+            narrative = llm_client.generate(build_schedule_prompt(events, metrics))
+            status = "ready"
+        except Exception as e:
+            print(f"Calendar insight generation failed: {e}")
+            narrative, status = None, "failed"
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                entry.update(status=status, narrative=narrative)
+        return narrative
+
+    def _entry(self, key, events, metrics):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry["status"] != "failed":
+                self._cache.move_to_end(key)
+                return entry
+            entry = {"status": "pending", "narrative": None}
+            entry["future"] = self._executor.submit(self._generate, key, events, metrics)
+            self._cache[key] = entry
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return entry
 
-    full_text = ""
-    for line in response.iter_lines():
-        if line:
-            # decode bytes to string
-            line_str = line.decode('utf-8')
-            # parse json from the line
-            json_obj = json.loads(line_str)
-            # append the "response" part to full_text
-            full_text += json_obj.get("response", "")
-
-    return full_text
\ No newline at end of file
+    def get(self, events, day=None):
+        """Metrics right away; narrative is None until the background job finishes."""
+        day = day or datetime.now().date()
+        events = events_on_day(events, day)
+        metrics = schedule_metrics(events, day)
+        key = schedule_hash(events, day)
+        if not events:
+            return {"schedule_hash": key, "metrics": metrics, "narrative_status": "ready",
+                    "narrative": "There are no events scheduled today."}
+        entry = self._entry(key, events, metrics)
+        return {
+            "schedule_hash": key,
+            "metrics": metrics,
+            "narrative_status": entry["status"],
+            "narrative": entry["narrative"]
+        }
+
+    def lookup(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            return {"schedule_hash": key, "narrative_status": entry["status"], "narrative": entry["narrative"]}
+
+    def narrative(self, events, timeout=None):
+        """Blocking variant: waits for (or reuses) the cached narrative."""
+        day = datetime.now().date()
+        events = events_on_day(events, day)
+        if not events:
+            return "There are no events scheduled today."
+        entry = self._entry(schedule_hash(events, day), events, schedule_metrics(events, day))
+        return entry["future"].result(timeout=timeout)
+
+
+calendar_insights = CalendarInsights()
+
+def format_events_for_prompt(events):
+    return calendar_insights.narrative(events)
+
+def ask_mistral(prompt):
+    return llm_client.generate(prompt)
@@ -0,0 +1,148 @@
+import os
+import time
+import threading
+from firebase_admin import firestore
+
+import llm_client
+from chatbot import MAX_HISTORY_MESSAGES
+
+# Older messages are folded into the summary once this many have piled up
+SUMMARY_BATCH_MESSAGES = int(os.environ.get("CHAT_SUMMARY_BATCH", "10"))
+FIRESTORE_BATCH_LIMIT = 500
+
+
+class ChatHistoryStore:
+    """Per-user chat history kept as one Firestore document per message.
+
+    chats/{user_id} holds counters and a rolling summary of older turns;
+    chats/{user_id}/messages/* holds the messages themselves, ordered by
+    "seq". Appends are small batched writes and reads fetch only the messages
+    not yet summarized, so neither grows with the length of the conversation.
+    """
+
+    def __init__(self, db, collection="chats", window=MAX_HISTORY_MESSAGES,
+                 summary_batch=SUMMARY_BATCH_MESSAGES):
+        self.db = db
+        self.collection = collection
+        self.window = window
+        self.summary_batch = summary_batch
+        self._summarizing = set()
+        self._lock = threading.Lock()
+
+    def _user_ref(self, user_id):
+        return self.db.collection(self.collection).document(user_id)
+
+    def _messages_ref(self, user_id):
+        return self._user_ref(user_id).collection("messages")
+
+    def load(self, user_id):
+        """Returns {"summary": str, "messages": [recent messages, oldest first]}.
+
+        The messages are the last `window` plus any older ones the summary
+        doesn't cover yet, so nothing drops out of the prompt between the
+        window and the next summary batch.
+        """
+        doc = self._user_ref(user_id).get()
+        data = doc.to_dict() if doc.exists else {}
+        if "messages" in data:
+            data = self._migrate(user_id, data)
+
+        unsummarized = data.get("message_count", 0) - data.get("summarized_count", 0)
+        limit = min(max(self.window, unsummarized), self.window + self.summary_batch)
+        query = (self._messages_ref(user_id)
+                 .order_by("seq", direction=firestore.Query.DESCENDING)
+                 .limit(limit))
+        messages = [
+            {"role": d["role"], "content": d["content"]}
+            for d in (snap.to_dict() for snap in query.stream())
+        ]
+        messages.reverse()
+        return {"summary": data.get("summary", ""), "messages": messages}
+
+    def append(self, user_id, *messages):
+        batch = self.db.batch()
+        base = time.time_ns()
+        for i, message in enumerate(messages):
+            batch.set(self._messages_ref(user_id).document(), {
+                "role": message["role"],
+                "content": message["content"],
+                "seq": base + i,
+                "createdAt": firestore.SERVER_TIMESTAMP
+            })
+        batch.set(self._user_ref(user_id), {
+            "message_count": firestore.Increment(len(messages)),
+            "updatedAt": firestore.SERVER_TIMESTAMP
+        }, merge=True)
+        batch.commit()
+        self._maybe_summarize(user_id)
+
+    def _migrate(self, user_id, data):
+        # Move a legacy whole-array document into the messages subcollection, once
+        legacy = data.pop("messages")
+        base = time.time_ns() - len(legacy)
+        for start in range(0, len(legacy), FIRESTORE_BATCH_LIMIT - 1):
+            batch = self.db.batch()
+            for i, message in enumerate(legacy[start:start + FIRESTORE_BATCH_LIMIT - 1], start):
+                batch.set(self._messages_ref(user_id).document(), {
+                    "role": message["role"],
+                    "content": message["content"],
+                    "seq": base + i
+                })
+            batch.commit()
+        data["message_count"] = data.get("message_count", 0) + len(legacy)
+        self._user_ref(user_id).set({
+            "messages": firestore.DELETE_FIELD,
+            "message_count": data["message_count"]
+        }, merge=True)
+        return data
+
+    def _maybe_summarize(self, user_id):
+        with self._lock:
+            if user_id in self._summarizing:
+                return
+            self._summarizing.add(user_id)
+        threading.Thread(target=self._summarize, args=(user_id,), daemon=True).start()
+
+    def _summarize(self, user_id):
+        try:
+            data = self._user_ref(user_id).get().to_dict() or {}
+            pending = data.get("message_count", 0) - data.get("summarized_count", 0) - self.window
+            if pending < self.summary_batch:
+                return
+
+            query = self._messages_ref(user_id).order_by("seq")
+            if data.get("summarized_seq") is not None:
+                query = query.start_after({"seq": data["summarized_seq"]})
+            older = [snap.to_dict() for snap in query.limit(pending).stream()]
+            if not older:
+                return
+
+            summary = summarize_turns(data.get("summary", ""), older)
+            self._user_ref(user_id).set({
+                "summary": summary,
+                "summarized_count": data.get("summarized_count", 0) + len(older),
+                "summarized_seq": older[-1]["seq"]
+            }, merge=True)
+        except Exception as e:
+            print(f"Failed to update chat summary for {user_id}: {e}")
+        finally:
+            with self._lock:
+                self._summarizing.discard(user_id)
+
+
+def summarize_turns(previous_summary, messages):
+    transcript = "\n".join(
+        f"{'User' if m['role'] == 'user' else 'Assistant'}: {m['content']}" for m in messages
+    )
+    prompt = f"""
+Update the running summary of a conversation between a user and a wellness assistant.
+Keep it under 120 words and keep facts about the user's feelings, stressors and plans.
+
+Current summary:
+{previous_summary or "(none)"}
+
+New messages:
+{transcript}
+
+Updated summary:"""
+    return llm_client.generate(prompt, options={"num_predict": 200}).split("Updated summary:")[-1].strip()
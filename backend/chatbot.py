@@ -1,8 +1,13 @@
 from flask import Flask, request, jsonify
-import requests
+import os
 import json
+import time
+import threading
+from collections import OrderedDict
 from firebase_admin import firestore
 
+import llm_client
+
 db = firestore.client()
 
 MAX_HISTORY_MESSAGES = 10 
@@ -29,38 +34,219 @@ def get_user_context(user_id):
         "calendar": calendars
     }
 
-def chat_with_mistral(messages, context_data=None):
+# Context window requested from Ollama; set explicitly so the carried session
+# context is never silently truncated by a smaller server default
+CHAT_NUM_CTX = int(os.environ.get("CHAT_NUM_CTX", "2048"))
+
+CHAT_OPTIONS = {
+    "num_predict": 40,  # lower = shorter
+    "num_ctx": CHAT_NUM_CTX
+}
+
+# Prompt evaluation time is roughly linear in tokens, so the whole prompt is capped
+CHAT_PROMPT_TOKEN_BUDGET = int(os.environ.get("CHAT_PROMPT_TOKEN_BUDGET", "1500"))
+# Share of the budget the journal/calendar context may use at most
+CONTEXT_BUDGET_SHARE = 0.4
+CONTEXT_JOURNAL_FIELDS = ("date", "createdAt", "mood", "entry", "content")
+CONTEXT_EVENT_FIELDS = ("summary", "subject", "start", "end")
+CONTEXT_TEXT_CHARS = 200
+
+def estimate_tokens(text):
+    # ~4 characters per token is close enough for budgeting English prompts
+    return len(text) // 4 + 1
+
+def _prune(doc, fields):
+    pruned = {}
+    for field in fields:
+        value = doc.get(field)
+        if value in (None, "", {}):
+            continue
+        if isinstance(value, dict):
+            value = value.get("dateTime") or value.get("date") or value
+        if isinstance(value, str) and len(value) > CONTEXT_TEXT_CHARS:
+            value = value[:CONTEXT_TEXT_CHARS] + "..."
+        pruned[field] = value
+    return pruned
+
+def _recency(doc):
+    return str(doc.get("createdAt") or doc.get("date") or "")
+
+def compact_context(context_data, max_tokens):
+    """Serializes journal/calendar context without indentation or unused fields.
+
+    Each item's size is estimated once; the most recent items are taken from
+    both lists in turn until the next one would not fit in max_tokens.
+    """
+    journals = sorted(context_data.get("journals", []), key=_recency, reverse=True)
+    events = sorted(context_data.get("calendar", []), key=_recency, reverse=True)
+    candidates = {
+        "journals": [_prune(doc, CONTEXT_JOURNAL_FIELDS) for doc in journals],
+        "calendar": [_prune(doc, CONTEXT_EVENT_FIELDS) for doc in events],
+    }
+    compact = {"journals": [], "calendar": []}
+    remaining = max_tokens - estimate_tokens(json.dumps(compact, separators=(",", ":")))
+
+    open_lists = [key for key in ("journals", "calendar") if candidates[key]]
+    while open_lists:
+        # Keep the two lists balanced, as dropping from the longer one used to
+        key = min(open_lists, key=lambda k: len(compact[k]))
+        item = candidates[key][len(compact[key])]
+        cost = estimate_tokens(json.dumps(item, separators=(",", ":"), default=str) + ",")
+        if cost > remaining:
+            open_lists.remove(key)
+            continue
+        compact[key].append(item)
+        remaining -= cost
+        if len(compact[key]) == len(candidates[key]):
+            open_lists.remove(key)
+
+    return json.dumps(compact, separators=(",", ":"), default=str)
+
+def build_chat_prompt(messages, context_data=None, summary=None, token_budget=None):
+    budget = CHAT_PROMPT_TOKEN_BUDGET if token_budget is None else token_budget
     system_prompt = (
         "You are a compassionate cognitive wellness assistant. "
         "Help the user reflect, manage stress, and suggest improvements to wellbeing. "
         "Be thoughtful and kind."
     )
 
-    conversation_text = system_prompt + "\n\n"
+    # Prepare conversation in Mistral prompt format:
+    # system prompt, compact context and summary of older turns first,
+    # then as many recent messages as still fit in the budget
+    header = system_prompt + "\n\n"
     if context_data:
-        context_str = json.dumps(context_data, indent=2)
-        conversation_text += f"Context:\n{context_str}\n\n"
+        context_str = compact_context(context_data, int(budget * CONTEXT_BUDGET_SHARE))
+        header += f"Context:\n{context_str}\n\n"
+    if summary:
+        header += f"Summary of earlier conversation:\n{summary}\n\n"
 
-    for msg in messages:
+    remaining = budget - estimate_tokens(header) - estimate_tokens("Assistant:")
+    lines = []
+    for msg in reversed(messages):
         role = msg["role"]
         content = msg["content"]
         if role == "user":
-            conversation_text += f"User: {content}\n"
+            line = f"User: {content}\n"
         else:  # assistant
-            conversation_text += f"Assistant: {content}\n"
+            line = f"Assistant: {content}\n"
+        cost = estimate_tokens(line)
+        # The latest message is always kept, even if it alone exceeds the budget
+        if lines and cost > remaining:
+            break
+        lines.append(line)
+        remaining -= cost
 
-    conversation_text += "Assistant:"
+    return header + "".join(reversed(lines)) + "Assistant:"
 
-    response = requests.post(
-        "http://localhost:11434/api/generate",
-        json={
-            "model": "mistral",
-            "prompt": conversation_text,
-            "stream": False
-        }
-    )
+def chat_with_mistral(messages, context_data=None, summary=None, session_id=None):
+    if session_id:
+        return chat_sessions.chat(session_id, messages, context_data, summary)
+    return llm_client.generate(build_chat_prompt(messages, context_data, summary), options=CHAT_OPTIONS)
+
+def stream_chat_with_mistral(messages, context_data=None, summary=None, session_id=None):
+    # Yields reply tokens as they are generated
+    if session_id:
+        return chat_sessions.stream_chat(session_id, messages, context_data, summary)
+    return llm_client.generate_stream(build_chat_prompt(messages, context_data, summary), options=CHAT_OPTIONS)
+
+CHAT_SESSION_IDLE_TTL = int(os.environ.get("CHAT_SESSION_IDLE_TTL", "1800"))  # seconds
+CHAT_MAX_SESSIONS = int(os.environ.get("CHAT_MAX_SESSIONS", "200"))
+# Start a fresh context before the carried-over one nears the model's window,
+# leaving room for the next user message and the reply
+CHAT_TURN_HEADROOM = 256
+CHAT_SESSION_MAX_CONTEXT = min(
+    int(os.environ.get("CHAT_SESSION_MAX_CONTEXT", str(CHAT_NUM_CTX))),
+    CHAT_NUM_CTX - CHAT_OPTIONS["num_predict"] - CHAT_TURN_HEADROOM
+)
+
+class ChatSession:
+    def __init__(self):
+        self.context = None
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+class ChatSessionManager:
+    """Keeps each conversation's Ollama context between turns.
+
+    The first turn sends the full prompt (system prompt, summary, recent
+    window); later turns send only the new user message together with the
+    context Ollama returned last time, so the shared prefix is not
+    re-evaluated. Contexts are rebuilt from the full prompt when they grow
+    past CHAT_SESSION_MAX_CONTEXT tokens, and idle sessions are dropped.
+    """
+
+    def __init__(self, idle_ttl=CHAT_SESSION_IDLE_TTL, max_sessions=CHAT_MAX_SESSIONS,
+                 max_context=CHAT_SESSION_MAX_CONTEXT):
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self.max_context = max_context
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.reused = 0
+        self.rebuilt = 0
+
+    def _get(self, session_id):
+        now = time.monotonic()
+        with self._lock:
+            # Sessions are kept in last-used order, so idle ones sit at the front
+            while self._sessions:
+                oldest = next(iter(self._sessions.values()))
+                if now - oldest.last_used <= self.idle_ttl:
+                    break
+                self._sessions.popitem(last=False)
+
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = ChatSession()
+                self._sessions[session_id] = session
+            self._sessions.move_to_end(session_id)
+            session.last_used = now
+
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return session
+
+    def _request(self, session, messages, context_data, summary):
+        if session.context and len(session.context) < self.max_context:
+            with self._lock:
+                self.reused += 1
+            content = messages[-1]["content"]
+            return f"User: {content}\nAssistant:", session.context
+        with self._lock:
+            self.rebuilt += 1
+        return build_chat_prompt(messages, context_data, summary), None
+
+    def chat(self, session_id, messages, context_data=None, summary=None):
+        session = self._get(session_id)
+        with session.lock:
+            prompt, context = self._request(session, messages, context_data, summary)
+            extra = {"context": context} if context else {}
+            result = llm_client.generate_raw(prompt, options=CHAT_OPTIONS, **extra)
+            session.context = result.get("context")
+            return result.get("response", "").strip()
+
+    def stream_chat(self, session_id, messages, context_data=None, summary=None):
+        session = self._get(session_id)
+        with session.lock:
+            prompt, context = self._request(session, messages, context_data, summary)
+            extra = {"context": context} if context else {}
+            # Drop the old context until the new one arrives; an interrupted stream starts fresh
+            session.context = None
+
+            def remember(final_chunk):
+                session.context = final_chunk.get("context")
+
+            yield from llm_client.generate_stream(prompt, options=CHAT_OPTIONS, on_done=remember, **extra)
+
+    def reset(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {"sessions": len(self._sessions), "reused": self.reused, "rebuilt": self.rebuilt}
 
-    return response.json().get("response", "").strip()
+chat_sessions = ChatSessionManager()
 
 def generate_chatbot_response(chat_history):
     # Dummy example, replace with your Mistral or GPT call
@@ -1,25 +1,144 @@
+import os
 import json
+import hashlib
+import threading
 from datetime import datetime
 import firebase_admin
 from firebase_admin import credentials, firestore
 
-def save_events_to_json(events):
-    today_str = datetime.now().strftime("%Y-%m-%d")
-    filename = f"calendar_events_{today_str}.json"
-    with open(filename, "w") as f:
-        json.dump(events, f, indent=2)
-    print(f"Saved calendar events to {filename}")
+FIRESTORE_BATCH_LIMIT = 500
+CALENDAR_SNAPSHOT_DIR = os.environ.get("CALENDAR_SNAPSHOT_DIR", "")  # empty disables JSON snapshots
 
-def upload_events_to_firestore(events):
+def get_db():
     if not firebase_admin._apps:
         cred = credentials.Certificate(r"NeuroBridge\backend\credentials\neurobridge.json")
         firebase_admin.initialize_app(cred)
+    return firestore.client()
 
-    db = firestore.client()
-    today = datetime.now().strftime("%Y-%m-%d")
+def event_hash(event):
+    return hashlib.sha256(json.dumps(event, sort_keys=True, default=str).encode("utf-8")).hexdigest()
 
-    # Optional: Clear and replace all events
-    doc_ref = db.collection("calendar_data").document(today)
-    doc_ref.set({"events": events})
+def _event_time(event, field):
+    value = event.get(field) or {}
+    return value.get("dateTime") or value.get("date")
 
-    print(f"Uploaded {len(events)} calendar events for {today} to Firestore")
+
+class CalendarStore:
+    """Per-user calendar events in calendar_events/{user_id}/events/{provider}_{event_id}.
+
+    Content hashes of what is already stored are kept in memory (loaded once
+    per user), so unchanged events are never rewritten.
+    """
+
+    def __init__(self, snapshot_dir=CALENDAR_SNAPSHOT_DIR):
+        self._hashes = {}
+        self._lock = threading.Lock()
+        self.snapshots = CalendarSnapshotWriter(snapshot_dir) if snapshot_dir else None
+
+    def _events_ref(self, db, user_id):
+        return db.collection("calendar_events").document(user_id).collection("events")
+
+    def _stored_hashes(self, db, user_id):
+        with self._lock:
+            hashes = self._hashes.get(user_id)
+        if hashes is None:
+            docs = self._events_ref(db, user_id).select(["content_hash"]).stream()
+            hashes = {doc.id: (doc.to_dict() or {}).get("content_hash") for doc in docs}
+            with self._lock:
+                hashes = self._hashes.setdefault(user_id, hashes)
+        return hashes
+
+    def save(self, user_id, provider, events, removed_ids=()):
+        """Write changed events and delete removed ones; returns the number of writes."""
+        db = get_db()
+        events_ref = self._events_ref(db, user_id)
+        hashes = self._stored_hashes(db, user_id)
+
+        writes = []
+        for event in events:
+            doc_id = f"{provider}_{event['id']}"
+            content_hash = event_hash(event)
+            if hashes.get(doc_id) == content_hash:
+                continue
+            writes.append((doc_id, content_hash, {
+                "user_id": user_id,
+                "provider": provider,
+                "event_id": event["id"],
+                "summary": event.get("summary") or event.get("subject"),
+                "start": _event_time(event, "start"),
+                "end": _event_time(event, "end"),
+                "event": event,
+                "content_hash": content_hash,
+                "updatedAt": firestore.SERVER_TIMESTAMP
+            }))
+        deletes = [f"{provider}_{event_id}" for event_id in removed_ids if f"{provider}_{event_id}" in hashes]
+
+        ops = [("set", doc_id, data) for doc_id, _, data in writes] + [("delete", doc_id, None) for doc_id in deletes]
+        for start in range(0, len(ops), FIRESTORE_BATCH_LIMIT):
+            batch = db.batch()
+            for op, doc_id, data in ops[start:start + FIRESTORE_BATCH_LIMIT]:
+                if op == "set":
+                    batch.set(events_ref.document(doc_id), data)
+                else:
+                    batch.delete(events_ref.document(doc_id))
+            batch.commit()
+
+        # Only record hashes once the batches have committed
+        with self._lock:
+            for doc_id, content_hash, _ in writes:
+                hashes[doc_id] = content_hash
+            for doc_id in deletes:
+                hashes.pop(doc_id, None)
+
+        if ops:
+            print(f"Stored {len(writes)} changed and removed {len(deletes)} {provider} calendar events for {user_id}")
+            if self.snapshots:
+                self.snapshots.schedule(user_id, events_ref)
+        return len(ops)
+
+
+class CalendarSnapshotWriter:
+    """Writes per-user JSON snapshots of stored events on a background thread."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def schedule(self, user_id, events_ref):
+        with self._cond:
+            # Several saves before the writer catches up collapse into one snapshot
+            self._pending[user_id] = events_ref
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name="calendar-snapshots")
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                user_id, events_ref = self._pending.popitem()
+            try:
+                self._write(user_id, events_ref)
+            except Exception as e:
+                print(f"Failed to write calendar snapshot for {user_id}: {e}")
+
+    def _write(self, user_id, events_ref):
+        events = [doc.to_dict().get("event") for doc in events_ref.stream()]
+        os.makedirs(self.directory, exist_ok=True)
+        # Hashed like record_store partitions, so distinct ids never share a file
+        name = hashlib.sha256(user_id.encode("utf-8")).hexdigest()
+        path = os.path.join(self.directory, f"calendar_events_{name}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"user_id": user_id, "saved_at": datetime.now().isoformat(), "events": events}, f, indent=2, default=str)
+        os.replace(tmp_path, path)
+
+
+calendar_store = CalendarStore()
+
+def save_calendar_events(user_id, provider, events, removed_ids=()):
+    return calendar_store.save(user_id, provider, events, removed_ids)
@@ -0,0 +1,272 @@
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Shared client for every call to the local Ollama server
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434")
+OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", "mistral")
+OLLAMA_CONNECT_TIMEOUT = float(os.environ.get("OLLAMA_CONNECT_TIMEOUT", "5"))
+OLLAMA_READ_TIMEOUT = float(os.environ.get("OLLAMA_READ_TIMEOUT", "120"))
+OLLAMA_MAX_RETRIES = int(os.environ.get("OLLAMA_MAX_RETRIES", "2"))
+OLLAMA_RETRY_BACKOFF = float(os.environ.get("OLLAMA_RETRY_BACKOFF", "0.5"))
+OLLAMA_MAX_CONCURRENCY = int(os.environ.get("OLLAMA_MAX_CONCURRENCY", "4"))
+# How long Ollama keeps the model (and its prompt cache) loaded after a request
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+
+OLLAMA_JSON_RETRIES = int(os.environ.get("OLLAMA_JSON_RETRIES", "2"))
+
+# Only failures where Ollama didn't start on the request are retried
+RETRYABLE_STATUS = {429, 503}
+
+
+class StructuredOutputError(ValueError):
+    def __init__(self, message, raw=""):
+        super().__init__(message)
+        self.raw = raw
+
+
+class LLMMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.streams = 0
+        self.total_first_token = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.structured_calls = 0
+        self.structured_attempts = 0
+        self.parse_failures = 0
+
+    def record_call(self, latency, result=None):
+        with self._lock:
+            self.calls += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            if result:
+                self.prompt_tokens += result.get("prompt_eval_count", 0)
+                self.completion_tokens += result.get("eval_count", 0)
+
+    def record_first_token(self, latency):
+        with self._lock:
+            self.streams += 1
+            self.total_first_token += latency
+
+    def record_structured(self, attempts, parse_failures):
+        with self._lock:
+            self.structured_calls += 1
+            self.structured_attempts += attempts
+            self.parse_failures += parse_failures
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "retries": self.retries,
+                "avg_latency_ms": round(self.total_latency / self.calls * 1000, 2) if self.calls else 0.0,
+                "max_latency_ms": round(self.max_latency * 1000, 2),
+                "avg_first_token_ms": round(self.total_first_token / self.streams * 1000, 2) if self.streams else 0.0,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "structured_calls": self.structured_calls,
+                "parse_failures": self.parse_failures,
+                "parse_failure_rate": round(
+                    self.parse_failures / self.structured_attempts, 3
+                ) if self.structured_attempts else 0.0,
+            }
+
+
+metrics = LLMMetrics()
+
+_session = requests.Session()
+_session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=OLLAMA_MAX_CONCURRENCY))
+_session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=OLLAMA_MAX_CONCURRENCY))
+_slots = threading.BoundedSemaphore(OLLAMA_MAX_CONCURRENCY)
+
+
+def _post(path, payload, timeout=None, stream=False):
+    # Keep-alive POST with bounded concurrency and retries on transient failures.
+    # A streamed response keeps its concurrency slot until the caller releases it.
+    timeout = timeout or (OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT)
+    attempt = 0
+    while True:
+        _slots.acquire()
+        try:
+            response = _session.post(f"{OLLAMA_URL}{path}", json=payload, timeout=timeout, stream=stream)
+            response.raise_for_status()
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.HTTPError) as e:
+            _slots.release()
+            status = e.response.status_code if e.response is not None else None
+            if e.response is not None:
+                e.response.close()
+            if status is not None:
+                retryable = status in RETRYABLE_STATUS
+            else:
+                # A read timeout means the server is busy generating; resending would add load
+                retryable = not isinstance(e, requests.exceptions.ReadTimeout)
+            if not retryable or attempt >= OLLAMA_MAX_RETRIES:
+                metrics.record_error()
+                raise
+            metrics.record_retry()
+            delay = OLLAMA_RETRY_BACKOFF * (2 ** attempt)
+            print(f"Ollama request failed ({e}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+            continue
+        except Exception:
+            _slots.release()
+            raise
+        if not stream:
+            _slots.release()
+        return response
+
+
+def generate_raw(prompt, model=None, options=None, timeout=None, **extra):
+    payload = {
+        "model": model or OLLAMA_MODEL,
+        "prompt": prompt,
+        "stream": False,
+    }
+    if options:
+        payload["options"] = options
+    if OLLAMA_KEEP_ALIVE:
+        payload["keep_alive"] = OLLAMA_KEEP_ALIVE
+    payload.update(extra)
+
+    start = time.monotonic()
+    result = _post("/api/generate", payload, timeout=timeout).json()
+    metrics.record_call(time.monotonic() - start, result)
+    return result
+
+
+def generate(prompt, model=None, options=None, timeout=None, **extra):
+    return generate_raw(prompt, model=model, options=options, timeout=timeout, **extra).get("response", "").strip()
+
+
+def generate_stream(prompt, model=None, options=None, timeout=None, on_done=None, **extra):
+    # Yields response tokens as Ollama produces them; on_done gets the final chunk
+    # (token counts, context) once the stream completes
+    payload = {
+        "model": model or OLLAMA_MODEL,
+        "prompt": prompt,
+        "stream": True,
+    }
+    if options:
+        payload["options"] = options
+    if OLLAMA_KEEP_ALIVE:
+        payload["keep_alive"] = OLLAMA_KEEP_ALIVE
+    payload.update(extra)
+
+    start = time.monotonic()
+    response = _post("/api/generate", payload, timeout=timeout, stream=True)
+    result = None
+    first_token = True
+    try:
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get("error"):
+                # Ollama reports failures after the headers as an error line
+                metrics.record_error()
+                raise RuntimeError(f"Ollama stream failed: {chunk['error']}")
+            token = chunk.get("response", "")
+            if token:
+                if first_token:
+                    metrics.record_first_token(time.monotonic() - start)
+                    first_token = False
+                yield token
+            if chunk.get("done"):
+                result = chunk
+                if on_done:
+                    on_done(chunk)
+                break
+        else:
+            metrics.record_error()
+            raise RuntimeError("Ollama stream ended before the reply was done")
+    finally:
+        response.close()
+        _slots.release()
+        metrics.record_call(time.monotonic() - start, result)
+
+
+def _validate(value, schema, path="$"):
+    # Covers the subset of JSON Schema we use: object/string/number/integer/boolean/array
+    expected = schema.get("type")
+    types = {
+        "object": dict, "array": list, "string": str,
+        "number": (int, float), "integer": int, "boolean": bool,
+    }
+    if expected:
+        # bool is a subclass of int, so reject it explicitly for numeric fields
+        if not isinstance(value, types[expected]) or (
+                expected in ("number", "integer") and isinstance(value, bool)):
+            raise StructuredOutputError(f"{path} should be {expected}")
+
+    if expected == "object":
+        for key in schema.get("required", []):
+            if key not in value:
+                raise StructuredOutputError(f"{path}.{key} is missing")
+        for key, subschema in schema.get("properties", {}).items():
+            if key in value:
+                _validate(value[key], subschema, f"{path}.{key}")
+    elif expected == "array" and "items" in schema:
+        for i, item in enumerate(value):
+            _validate(item, schema["items"], f"{path}[{i}]")
+    elif expected == "string":
+        if not value.strip() and schema.get("minLength", 0) > 0:
+            raise StructuredOutputError(f"{path} is empty")
+    elif expected in ("number", "integer"):
+        if "minimum" in schema and value < schema["minimum"]:
+            raise StructuredOutputError(f"{path} is below {schema['minimum']}")
+        if "maximum" in schema and value > schema["maximum"]:
+            raise StructuredOutputError(f"{path} is above {schema['maximum']}")
+
+
+def generate_json(prompt, schema, model=None, options=None, timeout=None, retries=None):
+    """Asks Ollama for JSON matching schema and returns the parsed object.
+
+    The schema is passed as Ollama's format constraint; the reply is still
+    validated here and the request is retried (up to retries extra times)
+    only when the output fails to parse or validate.
+    """
+    retries = OLLAMA_JSON_RETRIES if retries is None else retries
+    failures = 0
+    raw = ""
+    last_error = None
+    for attempt in range(retries + 1):
+        raw = generate(prompt, model=model, options=options, timeout=timeout, format=schema)
+        try:
+            value = json.loads(raw)
+            _validate(value, schema)
+        except ValueError as e:
+            failures += 1
+            last_error = e
+            print(f"Structured output rejected ({e}); raw: {raw[:200]!r}")
+            continue
+        metrics.record_structured(attempt + 1, failures)
+        return value
+
+    metrics.record_structured(retries + 1, failures)
+    metrics.record_error()
+    raise StructuredOutputError(f"No valid JSON after {failures} attempts: {last_error}", raw=raw)
+
+
+def get_metrics():
+    return metrics.snapshot()
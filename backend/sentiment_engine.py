@@ -0,0 +1,95 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+from transformers import pipeline
+
+# One DistilBERT pipeline shared by every module in the backend
+SENTIMENT_MODEL = "distilbert/distilbert-base-uncased-finetuned-sst-2-english"
+SENTIMENT_BATCH_SIZE = int(os.environ.get("SENTIMENT_BATCH_SIZE", "16"))
+SENTIMENT_BATCH_WAIT_MS = float(os.environ.get("SENTIMENT_BATCH_WAIT_MS", "5"))
+
+device = 0 if torch.cuda.is_available() else -1
+sentiment_pipeline = pipeline(
+    "sentiment-analysis",
+    model=SENTIMENT_MODEL,
+    device=device
+)
+
+
+def analyze_sentiment_batch(texts):
+    # Runs one batched forward pass and returns an upper-case label per text
+    texts = list(texts)
+    if not texts:
+        return []
+    results = sentiment_pipeline(texts, batch_size=min(len(texts), SENTIMENT_BATCH_SIZE), truncation=True)
+    return [result['label'].upper() for result in results]
+
+
+class SentimentBatcher:
+    """Coalesces concurrent single-text requests into batched pipeline calls.
+
+    Requests are collected for up to ``max_wait_ms`` after the first one
+    arrives, or until ``max_batch_size`` texts are queued, then scored together
+    and the labels are handed back to each waiting caller.
+    """
+
+    def __init__(self, max_batch_size=SENTIMENT_BATCH_SIZE, max_wait_ms=SENTIMENT_BATCH_WAIT_MS):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def submit(self, text):
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((text, future))
+        return future
+
+    def analyze(self, text):
+        return self.submit(text).result()
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="sentiment-batcher", daemon=True)
+                self._worker.start()
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            texts = [text for text, _ in batch]
+            try:
+                labels = analyze_sentiment_batch(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), label in zip(batch, labels):
+                future.set_result(label)
+
+
+sentiment_batcher = SentimentBatcher()
+
+
+def analyze_sentiment(text):
+    return sentiment_batcher.analyze(text)
@@ -0,0 +1,51 @@
+import os
+import threading
+import whisper
+import torch
+
+# Whisper model registry: each (size, device) pair is loaded at most once per process
+WHISPER_MODEL_SIZE = os.environ.get("WHISPER_MODEL_SIZE", "base")
+WHISPER_DEVICE = os.environ.get("WHISPER_DEVICE", "cuda" if torch.cuda.is_available() else "cpu")
+WHISPER_WARMUP = os.environ.get("WHISPER_WARMUP", "false").lower() in ("1", "true", "yes")
+
+_models = {}
+_model_locks = {}  # Whisper keeps decoder state on the model, so one transcription at a time per model
+_models_lock = threading.Lock()
+
+
+def get_whisper_model(size=None, device=None):
+    size = size or WHISPER_MODEL_SIZE
+    device = device or WHISPER_DEVICE
+    key = (size, device)
+
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    with _models_lock:
+        # Another request may have finished loading while we waited for the lock
+        model = _models.get(key)
+        if model is None:
+            print(f"Loading Whisper model '{size}' on {device}...")
+            model = whisper.load_model(size, device=device)
+            _model_locks[key] = threading.Lock()
+            _models[key] = model
+            print("Model loaded.")
+    return model
+
+
+def transcribe(audio_path, size=None, device=None, **options):
+    # The decoder's KV cache lives in forward hooks on the shared model, so
+    # concurrent calls on the same model would mix each other's cache
+    model = get_whisper_model(size, device)
+    with _model_locks[(size or WHISPER_MODEL_SIZE, device or WHISPER_DEVICE)]:
+        return model.transcribe(audio_path, **options)
+
+
+def warm_up_whisper(size=None, device=None):
+    # Called at startup so the first /analyze request doesn't pay the load cost
+    return get_whisper_model(size, device)
+
+
+def loaded_whisper_models():
+    return list(_models.keys())
@@ -0,0 +1,139 @@
+import os
+import queue
+import itertools
+import threading
+import time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from wellness_score import generate_wellness_from_data, get_cached_wellness, compute_wellness_score
+
+WELLNESS_WORKERS = int(os.environ.get("WELLNESS_WORKERS", "2"))
+WELLNESS_SCHEDULER_INTERVAL = int(os.environ.get("WELLNESS_SCHEDULER_INTERVAL", "300"))  # seconds
+WELLNESS_ACTIVE_WINDOW = int(os.environ.get("WELLNESS_ACTIVE_WINDOW", str(7 * 24 * 3600)))  # seconds
+# Hours (local time, "start-end") during which scores are precomputed for every active user
+WELLNESS_OFF_PEAK_HOURS = os.environ.get("WELLNESS_OFF_PEAK_HOURS", "1-5")
+
+
+def _parse_hours(spec):
+    start, end = (int(part) for part in spec.split("-"))
+    return start, end
+
+def is_off_peak(now=None, spec=WELLNESS_OFF_PEAK_HOURS):
+    hour = (now or datetime.now()).hour
+    start, end = _parse_hours(spec)
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end  # window wraps past midnight
+
+
+class WellnessScheduler:
+    """Serves cached wellness scores and refreshes them in the background.
+
+    Reads return the last computed score straight away, or just the score
+    when nothing is cached yet; stale scores and missing suggestions are
+    queued for recomputation, most recently active users first, on a bounded
+    worker pool. During off-peak hours every recently active user is
+    refreshed ahead of time so dashboard loads are cache hits.
+    """
+
+    def __init__(self, workers=WELLNESS_WORKERS, interval=WELLNESS_SCHEDULER_INTERVAL,
+                 active_window=WELLNESS_ACTIVE_WINDOW):
+        self.workers = workers
+        self.interval = interval
+        self.active_window = active_window
+        self._activity = {}
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._queue = queue.PriorityQueue()
+        self._order = itertools.count()
+        self._slots = threading.BoundedSemaphore(workers)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="wellness")
+        self._started = False
+        self.refreshed = 0
+        self.failed = 0
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._dispatch, name="wellness-dispatcher", daemon=True).start()
+        threading.Thread(target=self._plan, name="wellness-planner", daemon=True).start()
+
+    def touch(self, user_id):
+        with self._lock:
+            self._activity[user_id] = time.time()
+
+    def request_refresh(self, user_id):
+        with self._lock:
+            if user_id in self._pending:
+                return
+            self._pending.add(user_id)
+            last_active = self._activity.get(user_id, 0)
+        # Most recently active users come out of the queue first
+        self._queue.put((-last_active, next(self._order), user_id))
+
+    def get(self, user_id):
+        """The cached result, or the locally computed score with suggestion None
+        while the first suggestion is generated in the background."""
+        self.touch(user_id)
+        cached = get_cached_wellness(user_id)
+        if cached is None:
+            score = compute_wellness_score(user_id)
+            self.request_refresh(user_id)
+            return {"score": score, "suggestion": None}
+        result, fresh = cached
+        if not fresh:
+            self.request_refresh(user_id)
+        return result
+
+    def _dispatch(self):
+        while True:
+            _, _, user_id = self._queue.get()
+            self._slots.acquire()
+            self._executor.submit(self._refresh, user_id)
+
+    def _refresh(self, user_id):
+        try:
+            generate_wellness_from_data(user_id, force=True)
+            with self._lock:
+                self.refreshed += 1
+        except Exception as e:
+            print(f"Wellness refresh failed for {user_id}: {e}")
+            with self._lock:
+                self.failed += 1
+        finally:
+            with self._lock:
+                self._pending.discard(user_id)
+            self._slots.release()
+
+    def active_users(self):
+        cutoff = time.time() - self.active_window
+        with self._lock:
+            active = [(last, user_id) for user_id, last in self._activity.items() if last >= cutoff]
+        return [user_id for _, user_id in sorted(active, reverse=True)]
+
+    def _plan(self):
+        while True:
+            time.sleep(self.interval)
+            if not is_off_peak():
+                continue
+            for user_id in self.active_users():
+                cached = get_cached_wellness(user_id)
+                if cached is None or not cached[1]:
+                    self.request_refresh(user_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queued": self._queue.qsize(),
+                "pending": len(self._pending),
+                "tracked_users": len(self._activity),
+                "refreshed": self.refreshed,
+                "failed": self.failed
+            }
+
+
+wellness_scheduler = WellnessScheduler()
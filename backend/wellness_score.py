@@ -1,12 +1,28 @@
 import firebase_admin
 from firebase_admin import credentials, firestore
-import requests
+import os
 import json
+import time
+import threading
+from collections import Counter, deque
+from datetime import datetime
+
+import requests
+
+import llm_client
 
 cred = credentials.Certificate(r"credentials/neurobridge.json")
 firebase_admin.initialize_app(cred)
 db = firestore.client()
 
+WELLNESS_CACHE_TTL = int(os.environ.get("WELLNESS_CACHE_TTL", "600"))  # seconds
+WELLNESS_FALLBACK_TTL = int(os.environ.get("WELLNESS_FALLBACK_TTL", "60"))  # seconds a default suggestion is kept
+TIMESTAMP_FIELD = "createdAt"
+ALL_USERS = "__all__"
+
+# Mood labels used by the journal page, mapped onto -1..1
+MOOD_VALUES = {"happy": 1.0, "energetic": 1.0, "neutral": 0.0, "sad": -1.0, "stressed": -1.0}
+
 def get_user_data(user_id):
     journal_ref = db.collection('journals').document(user_id)
     calendar_ref = db.collection('calendar').document(user_id)
@@ -31,46 +47,210 @@ def get_all_data():
     return journals, calendars
 
 
-def generate_wellness_from_data():
-    journal_data, calendar_data = get_all_data()
-
-    prompt = f"""
-You are a cognitive wellness assistant. Given the user's journal and calendar data, generate a wellness score out of 100 and a short suggestion.
+def _parse_time(value):
+    if isinstance(value, dict):
+        value = value.get("dateTime") or value.get("date")
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    return None
 
-Journal Entries:
-{json.dumps(journal_data, indent=2)}
 
-Calendar Overview:
-{json.dumps(calendar_data, indent=2)}
+class WellnessFeatures:
+    """Running numeric summary of one user's journals and calendar.
 
-Respond in this format:
-Score: <number>
-Suggestion: <your suggestion>
+    Documents are folded in as they arrive, so the summary never needs the
+    full history again; the cursors remember the newest document seen.
     """
 
-    response = requests.post(
-        "http://localhost:11434/api/generate",
-        json={
-            "model": "mistral",
-            "prompt": prompt,
-            "stream": False
+    def __init__(self):
+        self.journal_count = 0
+        self.entry_words = 0
+        self.mood_counts = Counter()
+        self.recent_moods = deque(maxlen=10)
+        self.event_count = 0
+        self.scheduled_hours = 0.0
+        self.journal_cursor = None
+        self.calendar_cursor = None
+        self.scanned = set()  # collections already read in full once
+        self.version = 0
+
+    def add_journal(self, entry):
+        self.journal_count += 1
+        text = entry.get("entry") or entry.get("content") or ""
+        self.entry_words += len(text.split())
+        mood = entry.get("mood")
+        if mood:
+            self.mood_counts[mood] += 1
+            self.recent_moods.append(mood)
+        self.version += 1
+
+    def add_event(self, event):
+        self.event_count += 1
+        start = _parse_time(event.get("start"))
+        end = _parse_time(event.get("end"))
+        if start and end and end > start:
+            try:
+                self.scheduled_hours += (end - start).total_seconds() / 3600
+            except TypeError:
+                # Mixed naive/aware timestamps; skip the duration
+                pass
+        self.version += 1
+
+    def mood_balance(self, moods):
+        values = [MOOD_VALUES[mood] for mood in moods if mood in MOOD_VALUES]
+        return sum(values) / len(values) if values else 0.0
+
+    def summary(self):
+        return {
+            "journal_entries": self.journal_count,
+            "avg_entry_words": round(self.entry_words / self.journal_count, 1) if self.journal_count else 0,
+            "moods": dict(self.mood_counts),
+            "recent_moods": list(self.recent_moods),
+            "mood_balance": round(self.mood_balance(self.mood_counts.elements()), 2),
+            "recent_mood_balance": round(self.mood_balance(self.recent_moods), 2),
+            "calendar_events": self.event_count,
+            "avg_event_hours": round(self.scheduled_hours / self.event_count, 2) if self.event_count else 0,
         }
-    )
 
-    output = response.json()["response"]
-    lines = output.strip().splitlines()
+    def score(self):
+        # Heuristic 0-100: mood carries most weight, recent mood more than overall,
+        # long average events count as workload, journaling is a small bonus
+        summary = self.summary()
+        score = 60
+        score += 15 * summary["mood_balance"] + 20 * summary["recent_mood_balance"]
+        score -= min(15, max(0, summary["avg_event_hours"] - 1) * 5)
+        score += min(5, self.journal_count)
+        return round(max(0, min(100, score)))
+
+
+_features = {}
+_results = {}
+_locks = {}  # held across a whole refresh, LLM call included
+_feature_locks = {}  # held only while the features are updated
+_locks_lock = threading.Lock()
+
+def _user_lock(key, locks=_locks):
+    with _locks_lock:
+        return locks.setdefault(key, threading.Lock())
+
+def _fetch_new(collection, user_id, cursor, full_scan):
+    """Documents to fold in, oldest first.
+
+    The first fetch reads the whole collection, so documents without createdAt
+    still count (as they did in get_all_data). Later fetches only ask for
+    createdAt > cursor; new documents must carry createdAt to be picked up, and
+    with a user_id filter Firestore needs a composite index on
+    (user_id ASC, createdAt ASC) for both "journals" and "calendar".
+    """
+    query = db.collection(collection)
+    if user_id:
+        query = query.where("user_id", "==", user_id)
+    if full_scan:
+        docs = [doc.to_dict() for doc in query.stream()]
+        untimed = [doc for doc in docs if doc.get(TIMESTAMP_FIELD) is None]
+        timed = sorted((doc for doc in docs if doc.get(TIMESTAMP_FIELD) is not None), key=lambda doc: doc[TIMESTAMP_FIELD])
+        return untimed + timed
+    if cursor is not None:
+        query = query.where(TIMESTAMP_FIELD, ">", cursor)
+    return [doc.to_dict() for doc in query.order_by(TIMESTAMP_FIELD).stream()]
+
+def refresh_features(user_id=None):
+    """Folds any journal entries and calendar events newer than the cursors into the user's features."""
+    key = user_id or ALL_USERS
+    features = _features.setdefault(key, WellnessFeatures())
+
+    for entry in _fetch_new("journals", user_id, features.journal_cursor, "journals" not in features.scanned):
+        features.add_journal(entry)
+        features.journal_cursor = entry.get(TIMESTAMP_FIELD) or features.journal_cursor
+    features.scanned.add("journals")
+
+    for event in _fetch_new("calendar", user_id, features.calendar_cursor, "calendar" not in features.scanned):
+        features.add_event(event)
+        features.calendar_cursor = event.get(TIMESTAMP_FIELD) or features.calendar_cursor
+    features.scanned.add("calendar")
+
+    return features
 
-    score_line = next((line for line in lines if line.startswith("Score:")), None)
-    suggestion_line = next((line for line in lines if line.startswith("Suggestion:")), None)
+SUGGESTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "suggestion": {"type": "string", "minLength": 1}
+    },
+    "required": ["suggestion"]
+}
+DEFAULT_SUGGESTION = "Take a few minutes today for something that helps you relax."
+
+def generate_suggestion(summary):
+    prompt = f"""
+You are a cognitive wellness assistant. Here is a summary of the user's recent journal moods and calendar load:
+{json.dumps(summary, separators=(",", ":"))}
+
+Give one short, kind suggestion (at most two sentences) to improve their wellbeing.
+Respond with JSON: {{"suggestion": "<your suggestion>"}}"""
 
     try:
-        score = float(score_line.split(":", 1)[1].strip()) if score_line else None
-        suggestion = suggestion_line.split(":", 1)[1].strip() if suggestion_line else output
-    except Exception:
-        score = None
-        suggestion = output.strip()
-
-    return {
-        "score": score,
-        "suggestion": suggestion
-    }
+        output = llm_client.generate_json(prompt, SUGGESTION_SCHEMA, options={"num_predict": 120})
+        return output["suggestion"].strip()
+    except llm_client.StructuredOutputError as e:
+        # Retry budget spent; reuse the raw text only if it is plain prose,
+        # never half-formed JSON like {"suggestion": ""}
+        raw = e.raw.strip()
+        if not raw or "{" in raw or raw.startswith(("[", '"')):
+            return DEFAULT_SUGGESTION
+        return raw
+
+def compute_wellness_score(user_id=None):
+    """The score alone, from the incremental features; never waits on the LLM."""
+    with _user_lock(user_id or ALL_USERS, _feature_locks):
+        return refresh_features(user_id).score()
+
+def get_cached_wellness(user_id=None):
+    """Returns (result, is_fresh) for the last computed score, or None if there is none yet."""
+    cached = _results.get(user_id or ALL_USERS)
+    if not cached:
+        return None
+    return cached["result"], cached["expires_at"] > time.monotonic()
+
+def generate_wellness_from_data(user_id=None, force=False):
+    key = user_id or ALL_USERS
+    cached = _results.get(key)
+    if cached and not force and cached["expires_at"] > time.monotonic():
+        return cached["result"]
+
+    with _user_lock(key):
+        cached = _results.get(key)
+        if cached and not force and cached["expires_at"] > time.monotonic():
+            return cached["result"]
+
+        with _user_lock(key, _feature_locks):
+            features = refresh_features(user_id)
+            summary, score, version = features.summary(), features.score(), features.version
+
+        # Only ask the LLM again when the underlying data actually changed
+        fallback = False
+        if cached and cached["version"] == version and not cached["fallback"]:
+            suggestion = cached["result"]["suggestion"]
+        else:
+            try:
+                suggestion = generate_suggestion(summary)
+            except requests.RequestException as e:
+                # The score doesn't need the LLM; serve it with the default and retry soon
+                print(f"Wellness suggestion unavailable: {e}")
+                suggestion, fallback = DEFAULT_SUGGESTION, True
+
+        result = {
+            "score": score,
+            "suggestion": suggestion
+        }
+        _results[key] = {
+            "result": result,
+            "version": version,
+            "fallback": fallback,
+            "expires_at": time.monotonic() + (WELLNESS_FALLBACK_TTL if fallback else WELLNESS_CACHE_TTL)
+        }
+        return result